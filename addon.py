@@ -1,36 +1,38 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, division, unicode_literals
 
-import json
 import os
 import sys
-import traceback
+import time
 from datetime import datetime, date, timedelta
 from kodi_six import xbmc, xbmcaddon, xbmcgui, xbmcplugin, py2_encode, py2_decode
-from sqlite3 import Error as DBError
 
+# Kodi starts a new interpreter for every click, so anything imported here makes every click slower.
+# The database, HTTP client, JSON and HTML parsers are imported where they are used.
+from resources.lib import timing
 from resources.lib.constants import *
-from resources.lib.database import CacheDatabase, PublicationData, MediaData, TranslationData, Ignore
-from resources.lib.scrapper import JwOrgParser, unescape
+from resources.lib.datarow import PublicationData, MediaData, TranslationData, ResponseData, LanguageData, \
+    IssueData, Ignore
+
+started = time.time()
 
 Q = Query
 M = Mode
 
 try:
-    from urllib.error import HTTPError
     from urllib.parse import parse_qs, urlencode
-    from urllib.request import urlopen
 
 except ImportError:
-    from urllib2 import HTTPError, urlopen
     from urlparse import parse_qs as _parse_qs
     from urllib import urlencode as _urlencode
 
 
     # Py2: urlencode only accepts byte strings
     def urlencode(query):
-        # Dict[str, str] -> str
-        return py2_decode(_urlencode({py2_encode(param): py2_encode(arg) for param, arg in query.items()}))
+        # Union[Dict[str, str], List[Tuple[str, str]]] -> str
+        if isinstance(query, dict):
+            query = query.items()
+        return py2_decode(_urlencode([(py2_encode(param), py2_encode(arg)) for param, arg in query]))
 
 
     # Py2: even if parse_qs accepts unicode, the return makes no sense
@@ -49,6 +51,11 @@ class NotFoundError(Exception):
     pass
 
 
+class ConnectionFailedError(Exception):
+    """Raised on network errors, when the caller has asked to handle them (see get_json)"""
+    pass
+
+
 def log(msg, level=xbmc.LOGDEBUG):
     """Write to log file"""
 
@@ -56,37 +63,106 @@ def log(msg, level=xbmc.LOGDEBUG):
         xbmc.log(addon.getAddonInfo('id') + ': ' + line, level)
 
 
+def log_exception():
+    """Write the traceback of the current exception to the log file"""
+
+    import traceback
+    log(traceback.format_exc(), level=xbmc.LOGERROR)
+
+
 def notification(msg, icon=xbmcgui.NOTIFICATION_ERROR):
     """Show a GUI notification"""
 
     xbmcgui.Dialog().notification(addon.getAddonInfo('name'), msg, icon=icon)
 
 
-def get_json(url, exit_on_404=True):
-    # type: (str, bool) -> dict
-    """Fetch JSON data from an URL and return it as a dict"""
+def get_json(url, exit_on_404=True, max_age=None, exit_on_error=True, info=None):
+    # type: (str, bool, timedelta, bool, dict) -> dict
+    """Fetch JSON data from an URL and return it as a dict
 
-    log('opening ' + url, xbmc.LOGINFO)
+    If a previous response has been saved, it's revalidated with the server and reused if not modified.
+
+    :param max_age: Save the response, and reuse it without asking the server for this long
+    :param exit_on_error: Show an error and exit on network errors, instead of raising ConnectionFailedError
+        (use False in worker threads, where exit() would end up in the calling thread and roll back its batch)
+    :param info: Dict that gets filled in with where the response came from, in info['cache']:
+        'hit' (saved response, not checked with the server), 'not modified' or 'miss'
+    """
+    import json
+    from resources.lib.database import compress
+    from resources.lib.httpclient import HTTPError
+
+    start = time.time()
+    headers = {}
+    if info is None:
+        info = {}
     try:
-        # urlopen returns bytes
-        data = urlopen(url).read().decode('utf-8')
+        cached = next(cache.resp.select(ResponseData(url=url)))
+        if max_age and datetime.now() < cached.refreshed + max_age:
+            log('using saved response for ' + url)
+            info['cache'] = 'hit'
+            timing.record('http', url, start, info)
+            return json.loads(cached.body.decode('utf-8'))
+        if cached.etag:
+            headers['If-None-Match'] = cached.etag
+        if cached.modified:
+            headers['If-Modified-Since'] = cached.modified
+    except StopIteration:
+        cached = None
 
-    # Catches URLError, HTTPError, SSLError ...
+    log('opening ' + url, xbmc.LOGINFO)
+    info['cache'] = 'miss'
+    try:
+        response = http_client.request(url, headers=headers)
+        info['status'] = response.status
+        if response.status == 304 and cached:
+            response.read()
+            log('not modified, using saved response')
+            info['cache'] = 'not modified'
+            data = cached.body
+            if max_age:
+                # Start over the max_age period
+                cache.resp.upsert_many([ResponseData(url=url, etag=cached.etag, modified=cached.modified,
+                                                     body=compress(data), refreshed=datetime.now())])
+        else:
+            data = response.read()
+            info['bytes'] = len(data)
+            etag = response.getheader('ETag')
+            modified = response.getheader('Last-Modified')
+            # Without validators (or max_age) there's no way to know when to reuse the response
+            if etag or modified or max_age:
+                with cache.batch():
+                    cache.resp.upsert_many([ResponseData(url=url, etag=etag, modified=modified,
+                                                         body=compress(data), refreshed=datetime.now())])
+                    # Make room while we're at it, old responses are unlikely to be asked for again
+                    cache.resp.delete_older(datetime.now() - timedelta(days=RESPONSES_MAX_AGE))
+
+    # Catches HTTPError, socket errors, SSLError ...
     except IOError as e:
+        info['status'] = getattr(e, 'code', 'error')
         # Pass on 404 for handling by someone else
         if isinstance(e, HTTPError) and e.code == 404 and not exit_on_404:
             log('404 not found, ignoring')
             raise NotFoundError
-        log(traceback.format_exc(), level=xbmc.LOGERROR)
-        notification(S.CONNECTION_ERROR)
+        log_exception()
+        if not exit_on_error:
+            raise ConnectionFailedError
+        if not background:
+            notification(S.CONNECTION_ERROR)
         exit(1)
         raise  # to make PyCharm happy
 
-    return json.loads(data)
+    finally:
+        timing.record('http', url, start, info)
+
+    return json.loads(data.decode('utf-8'))
 
 
-def getpubmedialinks_json(pubdata, alllangs=False, exit_on_404=True):
-    """Make a request to JW API and return JSON as a dict"""
+def getpubmedialinks_json(pubdata, alllangs=False, **kwargs):
+    """Make a request to JW API and return JSON as a dict
+
+    Other arguments are passed on to get_json.
+    """
 
     assert pubdata.pub
 
@@ -100,7 +176,7 @@ def getpubmedialinks_json(pubdata, alllangs=False, exit_on_404=True):
                  alllangs=int(alllangs))
     # Remove empty queries
     query = {key: value for key, value in query.items() if value is not None}
-    return get_json(PUBMEDIA_API + '?' + urlencode(query), exit_on_404=exit_on_404)
+    return get_json(PUBMEDIA_API + '?' + urlencode(query), **kwargs)
 
 
 def request_to_self(mode, pubdata=None, pub=None, year=None, lang=None, langname=None, track=None):
@@ -118,89 +194,235 @@ def request_to_self(mode, pubdata=None, pub=None, year=None, lang=None, langname
     :param track: Track number (for direct playback)
     """
 
-    query = {Q.MODE: mode,
-             Q.PUB: pub,
-             Q.LANG: lang,
-             Q.LANG_NAME: langname,
-             Q.YEAR: year,
-             Q.TRACK: track}
+    # Note: the order must stay the same, or Kodi will forget the "viewed status" of all items
+    query = [(Q.MODE, mode),
+             (Q.PUB, pub),
+             (Q.LANG, lang),
+             (Q.LANG_NAME, langname),
+             (Q.YEAR, year),
+             (Q.TRACK, track)]
 
     # Overwrite empty values with values from pubdata
     # Note: do not include language in the request, unless explicitly specified
     # This will enable "viewed status" in Kodi to work for all languages
     if pubdata:
-        query.update({
-            Q.PUB: pub or pubdata.pub,
-            Q.ISSUE: pubdata.issue,
-            Q.BOOKNUM: pubdata.booknum})
+        query[1] = (Q.PUB, pub or pubdata.pub)
+        query += [(Q.ISSUE, pubdata.issue),
+                  (Q.BOOKNUM, pubdata.booknum)]
 
     # Remove empty queries
-    query = {key: value for key, value in query.items() if value is not None}
+    query = [(key, value) for key, value in query if value is not None]
 
     # argv[0] is path to the plugin
     return str(sys.argv[0]) + '?' + urlencode(query)
 
 
+def request_template(mode, pubdata=None, **kwargs):
+    # type: (str, PublicationData, ...) -> str
+    """Like request_to_self, but return a format string for the items of a listing
+
+    Use '{name}' as value for the queries that differ between items, and fill them in with format().
+    It saves encoding all queries for every item, but only works for values that don't need escaping,
+    like numbers and publication codes. For example:
+
+        template = request_template(M.OPEN, pubdata=pubdata, track='{track}')
+        template.format(track=1)
+    """
+    # Braces are always escaped by urlencode, so these are the placeholders
+    return request_to_self(mode, pubdata=pubdata, **kwargs).replace('%7B', '{').replace('%7D', '}')
+
+
 def get_translation(key):
-    """Quick way to get a translated string from the cache"""
+    """Quick way to get a translated string from the cache
 
-    try:
-        search = TranslationData(key=key, lang=global_language)
-        result = next(cache.trans.select(search))
-        return result.string
-    except StopIteration:
+    All translations of the current language are loaded the first time, see forget_translations().
+    """
+    global translations
+
+    # No translations are scrapped for English, so don't open the database for nothing
+    if global_language == 'E':
         return None
+    if translations is None:
+        translations = {row.key: row.string for row in cache.trans.select(TranslationData(lang=global_language))}
+    return translations.get(key)
+
+
+def forget_translations():
+    """Make get_translation() load the translations again (after they or the language have changed)"""
+
+    global translations
+    translations = None
 
 
-def update_translations(lang):
-    """Download a jw.org web page and save some extracted strings to cache"""
+def scrap_translations(lang):
+    # type: (str) -> dict
+    """Download a jw.org web page and return some extracted strings, or None if it failed"""
+
+    from resources.lib.scrapper import JwOrgParser
+
+    url = '{}?docid={}&wtlocale={}'.format(FINDER_API, DOCID_MAGAZINES, lang)
+    log('scrapping translations from ' + url)
+    with timing.Span('http', url, {'cache': 'miss'}) as info:
+        try:
+            # Set high timeout, because AWS blocks requests from urllib for a while
+            response = http_client.request(url, timeout=30)
+            info['status'] = response.status
+            try:
+                # Only the top of the page is needed, the rest is never downloaded
+                return JwOrgParser.parse_stream(response.iter_text())
+            finally:
+                response.close()
+        except IOError as e:
+            info['status'] = getattr(e, 'code', 'error')
+            log_exception()
+            return None
 
-    # If there are any translations for the current language in the cache, do nothing
-    if any(cache.trans.select(TranslationData(lang=lang))):
+
+def outdated_translations():
+    # type: () -> list
+    """Return the languages in the history that have missing or too old translations
+
+    Languages that have been tried recently are left out, even if that failed.
+    """
+
+    # There are no translations for English
+    languages = [lang for lang in addon.getSetting(SettingID.LANG_HIST).split() if lang != 'E']
+    if global_language != 'E' and global_language not in languages:
+        languages.append(global_language)
+    if not languages:
+        return []
+
+    # Translations are saved all at once per language, so checking one of them is enough
+    refreshed = {}
+    attempted = {}
+    for row in cache.trans.select():
+        if row.key == TRANSLATIONS_ATTEMPT:
+            attempted[row.lang] = row.refreshed
+        else:
+            refreshed[row.lang] = row.refreshed
+
+    now = datetime.now()
+    return [lang for lang in languages
+            if not refreshed.get(lang) or now > refreshed[lang] + timedelta(days=TRANSLATIONS_MAX_AGE)
+            if not attempted.get(lang) or now > attempted[lang] + timedelta(days=TRANSLATIONS_RETRY)]
+
+
+def translations_busy():
+    # type: () -> bool
+    """Check if update_translations is running in another process"""
+
+    started = xbmcgui.Window(10000).getProperty(translations_property)
+    # In case it never finished
+    return bool(started) and time.time() < float(started) + TRANSLATIONS_TIMEOUT
+
+
+def update_translations():
+    """Scrap translations for all languages in the history, which are missing or too old
+
+    Meant to run in the background (see start_translations_update), the languages are scrapped concurrently.
+    """
+    from resources.lib.workers import imap_unordered
+
+    if translations_busy():
+        log('translations are already being updated')
+        return
+    outdated = outdated_translations()
+    if not outdated:
         return
 
-    progressbar = xbmcgui.DialogProgress()
-    progressbar.create('', S.TRANS_UPDATE)
-    progressbar.update(50)
+    # Home window properties are shared by all instances of the add-on
+    home = xbmcgui.Window(10000)
+    home.setProperty(translations_property, str(time.time()))
     try:
-        url = '{}?docid={}&wtlocale={}'.format(FINDER_API, DOCID_MAGAZINES, lang)
-        log('scrapping translations from ' + url)
-        # urlopen returns bytes
-        # Set high timeout, because AWS blocks requests from urllib for a while
-        response = urlopen(url, timeout=30).read().decode('utf-8')
-        translations = JwOrgParser.parse(response)
-        for key, value in translations.items():
-            cache.trans.delete(TranslationData(key=key, lang=lang))
-            cache.trans.insert(TranslationData(key=key, string=value, lang=lang))
+        # Only the network requests run in threads, and everything is saved with a single commit
+        now = datetime.now()
+        with cache.batch():
+            for i, strings in imap_unordered(scrap_translations, outdated, TRANSLATIONS_THREADS):
+                lang = outdated[i]
+                # Keep the old translations if it failed
+                if strings:
+                    cache.trans.delete(TranslationData(lang=lang))
+                    cache.trans.upsert_many(TranslationData(key=key, string=value, lang=lang, refreshed=now)
+                                            for key, value in strings.items())
+                # Don't try again right away, whatever happened (jw.org blocks scrappers that keep trying)
+                cache.trans.upsert_many([TranslationData(key=TRANSLATIONS_ATTEMPT, lang=lang, refreshed=now)])
+        forget_translations()
     finally:
-        progressbar.close()
+        home.clearProperty(translations_property)
+
+
+def start_translations_update():
+    """Run update_translations in another process, so that nothing has to wait for it"""
 
+    if enable_scrapper and not translations_busy():
+        # RunPlugin opens in the background
+        xbmc.executebuiltin('RunPlugin(' + request_to_self(M.TRANSLATIONS) + ')')
 
-def download_pub_data(pubdata):
-    # type: (PublicationData) -> ()
+
+def cache_failed_pub(pubdata):
+    # type: (PublicationData) -> None
+    """Cache the failure... yes, that's right, so we don't retry for a while"""
+
+    failed_pub = PublicationData.copy(pubdata)
+    failed_pub.failed = datetime.now()
+    with cache.batch():
+        cache.publ.upsert_many([failed_pub])
+        save_issue_availability(pubdata, False)
+
+
+def save_issue_availability(pubdata, available):
+    # type: (PublicationData, bool) -> None
+    """Remember if a magazine issue was available, for the issue index"""
+
+    if pubdata.issue and not pubdata.booknum:
+        cache.issues.upsert_many([IssueData(pub=pubdata.pub, lang=pubdata.lang, year=int(pubdata.issue[:4]),
+                                            issue=pubdata.issue, available=available, checked=datetime.now())])
+
+
+def get_issue_index(pub):
+    # type: (str) -> dict
+    """Return what is known about the issues of a magazine in the current language, as {issue: IssueData}"""
+
+    return {row.issue: row for row in cache.issues.select(IssueData(pub=pub, lang=global_language))}
+
+
+def is_known_missing(row):
+    # type: (IssueData) -> bool
+    """Check if an index entry says that an issue is not available (and it's not yet time to check again)"""
+
+    if row is None or row.available:
+        return False
+    # Recordings of old issues are less likely to show up, so check them less often
+    if row.year < date.today().year:
+        return datetime.now() < row.checked + timedelta(days=30)
+    else:
+        return datetime.now() < row.checked + timedelta(days=1)
+
+
+def download_pub_data(pubdata, exit_on_error=True):
+    # type: (PublicationData, bool) -> ()
     """Download and cache publication metadata
 
     Return publication and list of contained media
+
+    :param exit_on_error: See get_json
     """
     try:
-        j = getpubmedialinks_json(pubdata, exit_on_404=False)
-
+        j = getpubmedialinks_json(pubdata, exit_on_404=False, exit_on_error=exit_on_error)
     except NotFoundError:
-        # Cache the failure... yes, that's right, so we don't retry for a while
-        cache.publ.delete(pubdata)
-        failed_pub = PublicationData.copy(pubdata)
-        failed_pub.failed = datetime.now()
-        cache.publ.insert(failed_pub)
+        cache_failed_pub(pubdata)
         raise
 
-    # Remove old publication metadata
-    cache.publ.delete(pubdata)
+    return save_pub_data(pubdata, j)
+
 
-    # For bible index page: remove all bible books' metadata
-    # if pubdata.booknum == 0:
-    #    bible = PublicationData.copy(pubdata)
-    #    bible.booknum = Ignore
-    #    cache.publ.delete(bible)
+def save_pub_data(pubdata, j):
+    # type: (PublicationData, dict) -> ()
+    """Cache publication metadata from a GETPUBMEDIALINKS response
+
+    Return publication and list of contained media
+    """
+    from resources.lib.scrapper import unescape
 
     # Store new publication metadata
     # Note: opening a publication will refresh its metadata so that will deal with deprecated entries
@@ -212,12 +434,37 @@ def download_pub_data(pubdata):
     # Don't save Bible icons - they are ugly atm
     if pubdata.pub not in ('bi12', 'nwt'):
         new_pub.icon = j.get('pubImage', {}).get('url')
-    # Don't save Bible books' metadata, it's refreshed each time so there's no need
-    if pubdata.booknum is None or pubdata.booknum == 0:
-        cache.publ.insert(new_pub)
+    new_pub.refreshed = datetime.now()
+
+    media_list, sub_pub_list = parse_pub_files(pubdata, j)
+
+    # Save everything in one go, and replace the cached track list
+    with cache.batch():
+        if pubdata.booknum == 0:
+            # For the Bible index: replace all books (they're listed with the titles of the index, so keep those)
+            bible = PublicationData(pub=pubdata.pub, lang=pubdata.lang)
+            cache.publ.delete(bible)
+            cache.publ.upsert_many([new_pub] + sub_pub_list)
+        elif pubdata.booknum is None:
+            cache.publ.upsert_many([new_pub])
+        save_media_list(pubdata, media_list)
+        save_issue_availability(pubdata, True)
+
+    for p in [new_pub] + sub_pub_list:
+        artwork.add(p.icon)
+
+    return new_pub, sub_pub_list or media_list
+
+
+def parse_pub_files(pubdata, j):
+    # type: (PublicationData, dict) -> ()
+    """Return a list of media and a list of sub publications (bible books) for pubdata.lang in the JSON"""
+
+    from resources.lib.scrapper import unescape
 
     media_list = []
     sub_pub_list = []
+    now = datetime.now()
     try:
         for j_file in j['files'][pubdata.lang]['MP3']:
             try:
@@ -228,6 +475,10 @@ def download_pub_data(pubdata):
                     m.title = unescape(j_file['title'])
                     m.duration = j_file.get('duration')
                     m.track = int(j_file.get('track'))
+                    m.refreshed = now
+                    # For checking downloads
+                    m.filesize = j_file.get('filesize')
+                    m.checksum = j_file['file'].get('checksum')
                     media_list.append(m)
 
                 # For the bible index page: make a list of the bible books' metadata
@@ -235,8 +486,7 @@ def download_pub_data(pubdata):
                     sub_pub = PublicationData.copy(pubdata)
                     sub_pub.title = unescape(j_file['title'])
                     sub_pub.booknum = int(j_file['booknum'])
-                    # We could store it in the database, but since it refreshes every time, that's not necessary
-                    # cache.publ.insert(sub_pub)
+                    sub_pub.refreshed = now
                     sub_pub_list.append(sub_pub)
 
             except KeyError:
@@ -245,14 +495,37 @@ def download_pub_data(pubdata):
     except KeyError:
         pass
 
-    return new_pub, sub_pub_list or media_list
+    return media_list, sub_pub_list
 
 
-def get_pub_data(pubdata):
-    # type: (PublicationData) -> ()
-    """Get publication metadata from cache (download if needed)"""
+def save_media_list(pubdata, media_list):
+    # type: (PublicationData, list) -> None
+    """Replace the cached track list of a publication"""
+
+    with cache.batch():
+        cache.media.delete(MediaData.copy(pubdata))
+        cache.media.upsert_many(media_list)
+
+
+def save_all_languages(pubdata, j):
+    # type: (PublicationData, dict) -> None
+    """Cache the track lists of all languages in a GETPUBMEDIALINKS response made with alllangs"""
+
+    with cache.batch():
+        for lang in j.get('files', {}):
+            lang_pub = PublicationData.copy(pubdata)
+            lang_pub.lang = lang
+            media_list, sub_pub_list = parse_pub_files(lang_pub, j)
+            # Publication titles are only in the requested language, so don't touch the publications table
+            save_media_list(lang_pub, media_list)
+
 
-    # Check for previous records
+def get_cached_pub_data(pubdata):
+    # type: (PublicationData) -> PublicationData
+    """Get publication metadata from cache, return None if it needs to be downloaded
+
+    Raises NotFoundError if the publication has failed recently.
+    """
     try:
         cached_pub = next(cache.publ.select(pubdata))
         if cached_pub.failed is None:
@@ -263,9 +536,95 @@ def get_pub_data(pubdata):
             raise NotFoundError
     except StopIteration:
         pass
-    # Refresh
-    pub, media = download_pub_data(pubdata)
-    return pub
+    return None
+
+
+def get_pub_data(pubdata):
+    # type: (PublicationData) -> PublicationData
+    """Get publication metadata from cache (download if needed)"""
+
+    return get_cached_pub_data(pubdata) or download_pub_data(pubdata)[0]
+
+
+def get_media_list(pubdata):
+    # type: (PublicationData) -> list
+    """Get the list of media in a publication from cache (download if needed)"""
+
+    media_list = list(cache.media.select(MediaData.copy(pubdata)))
+    # Tracks are saved all at once, so checking one of them is enough
+    if media_list and datetime.now() < media_list[0].refreshed + timedelta(days=1):
+        return media_list
+
+    # Without network, an old track list is better than nothing (the files may have been downloaded)
+    try:
+        pub, media_list = download_pub_data(pubdata, exit_on_error=not media_list)
+    except ConnectionFailedError:
+        log('using outdated track list')
+    return media_list
+
+
+def get_bible_index(pubdata):
+    # type: (PublicationData) -> list
+    """Get the list of books in a Bible from cache (download if needed), sorted by book number"""
+
+    rows = list(cache.publ.select(PublicationData(pub=pubdata.pub, lang=pubdata.lang)))
+    index = next((row for row in rows if row.booknum == 0), None)
+    books = sorted((row for row in rows if row.booknum and row.failed is None), key=lambda row: row.booknum)
+    # Books are saved all at once with the index, so checking the index is enough
+    if books and index and index.refreshed and datetime.now() < index.refreshed + timedelta(days=1):
+        return books
+
+    pub, books = download_pub_data(pubdata)
+    return books
+
+
+def get_pub_data_many(requests, max_workers=8):
+    # type: (list, int) -> ()
+    """Like get_pub_data, but for many publications at once
+
+    Cached publications are yielded right away, the rest are downloaded concurrently.
+    Yields (index, publication) as soon as they are available. Publication is None if it's not available,
+    or if it couldn't be downloaded (then it's not cached as failed, and an error is shown at the end).
+    """
+    from resources.lib.workers import imap_unordered
+
+    def fetch(request):
+        try:
+            return getpubmedialinks_json(request, exit_on_404=False, exit_on_error=False)
+        except NotFoundError:
+            return None
+        except ConnectionFailedError as e:
+            return e
+
+    to_download = []
+    for i, request in enumerate(requests):
+        try:
+            cached_pub = get_cached_pub_data(request)
+        except NotFoundError:
+            yield i, None
+            continue
+        if cached_pub:
+            yield i, cached_pub
+        else:
+            to_download.append(i)
+
+    # The requests run in threads, and so does the saving of responses in get_json. If the caller has opened
+    # a batch, those writes are part of its transaction (and are rolled back with it). The publications
+    # are saved here in the calling thread.
+    connection_failed = False
+    for n, j in imap_unordered(fetch, [requests[i] for i in to_download], max_workers):
+        request = requests[to_download[n]]
+        if isinstance(j, ConnectionFailedError):
+            connection_failed = True
+            yield to_download[n], None
+        elif j is None:
+            cache_failed_pub(request)
+            yield to_download[n], None
+        else:
+            yield to_download[n], save_pub_data(request, j)[0]
+
+    if connection_failed and not background:
+        notification(S.CONNECTION_ERROR)
 
 
 class MenuItem(object):
@@ -292,32 +651,43 @@ class MenuItem(object):
 
         # setArt can be kinda slow, so don't run if it's empty
         if self.icon or self.fanart:
-            li.setArt(dict(icon=self.icon, poster=self.icon, fanart=self.fanart))
+            icon = artwork.get(self.icon)
+            li.setArt(dict(icon=icon, poster=icon, fanart=self.fanart))
 
         return li
 
-    def add_item_in_kodi(self, total=0):
-        """Adds this as a directory item in Kodi"""
+    def directory_item(self):
+        """Return a tuple for xbmcplugin.addDirectoryItems"""
 
-        # totalItems doesn't seem to have any effect in Estuary skin, but let's keep it anyway
-        xbmcplugin.addDirectoryItem(handle=addon_handle, url=self.url, listitem=self.listitem(),
-                                    isFolder=self.is_folder, totalItems=total)
+        with timing.Span('listitem', self.title):
+            return self.url, self.listitem(), self.is_folder
 
 
 class PublicationItem(MenuItem):
-    """A folder that represents a publication
-
-    At the moment, it's virtually identical to a MenuItem
-    """
-
-    def __init__(self, pubdata):
-        # type: (PublicationData) -> None
-
+    """A folder that represents a publication"""
+
+    def __init__(self, pubdata, url=None, download_url=None):
+        # type: (PublicationData, str, str) -> None
+        """
+        :param url: Precomputed URL to open the publication (see request_template)
+        :param download_url: Precomputed URL to download the publication
+        """
         super(PublicationItem, self).__init__(
-            url=request_to_self(M.OPEN, pubdata=pubdata),
+            url=url or request_to_self(M.OPEN, pubdata=pubdata),
             title=pubdata.title,
             icon=pubdata.icon
         )
+        # Downloading the Bible index would mean downloading the whole Bible
+        if pubdata.booknum == 0:
+            self.download_url = None
+        else:
+            self.download_url = download_url or request_to_self(M.DOWNLOAD, pubdata=pubdata)
+
+    def listitem(self):
+        li = super(PublicationItem, self).listitem()
+        if self.download_url:
+            li.addContextMenuItems([(S.DOWNLOAD, 'RunPlugin(' + self.download_url + ')')])
+        return li
 
 
 class MediaItem(MenuItem):
@@ -325,14 +695,18 @@ class MediaItem(MenuItem):
 
     is_folder = False
 
-    def __init__(self, mediadata):
-        # type: (MediaData) -> None
-        self.pubdata = PublicationData.copy(mediadata)
+    def __init__(self, mediadata, templates=None):
+        # type: (MediaData, dict) -> None
+        """
+        :param templates: Precomputed URL templates (see track_templates)
+        """
         self.track = mediadata.track
         self.duration = mediadata.duration
         self.resolved_url = mediadata.url
+        # The media data has all the publication info that's needed for the URLs, no need to copy it
+        self.templates = templates or track_templates(mediadata)
         super(MediaItem, self).__init__(
-            url=request_to_self(M.OPEN, pubdata=self.pubdata, track=self.track),
+            url=self.templates[M.OPEN].format(track=self.track),
             title=mediadata.title
         )
 
@@ -344,10 +718,12 @@ class MediaItem(MenuItem):
         # For some reason needed for listitems that will open xbmcplugin.setResolvedUrl
         li.setProperty('isPlayable', 'true')
 
-        # Other language action
+        # Other language, play all and download actions
         # Note: RunPlugin opens as a background process
-        action = 'RunPlugin(' + request_to_self(M.LANGUAGES, pubdata=self.pubdata, track=self.track) + ')'
-        li.addContextMenuItems([(S.PLAY_LANG, action)])
+        li.addContextMenuItems([(label, 'RunPlugin(' + self.templates[mode].format(track=self.track) + ')')
+                                for label, mode in ((S.PLAY_LANG, M.LANGUAGES),
+                                                    (S.PLAY_FROM_HERE, M.PLAY_ALL),
+                                                    (S.DOWNLOAD, M.DOWNLOAD))])
 
         return li
 
@@ -357,6 +733,39 @@ class MediaItem(MenuItem):
         return li
 
 
+def track_templates(pubdata):
+    # type: (PublicationData) -> dict
+    """Return request_template() for all actions of the tracks in a publication, as {mode: template}"""
+
+    return {mode: request_template(mode, pubdata=pubdata, track='{track}')
+            for mode in (M.OPEN, M.LANGUAGES, M.PLAY_ALL, M.DOWNLOAD)}
+
+
+def media_items(pubdata, media_list):
+    # type: (PublicationData, list) -> list
+    """Return MediaItems for the tracks of a publication, sorted by track number"""
+
+    templates = track_templates(pubdata)
+    return [MediaItem(m, templates) for m in sorted(media_list, key=lambda x: x.track)]
+
+
+class Listing(object):
+    """The items of a folder, which are added to Kodi all at once"""
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, item):
+        # type: (MenuItem) -> None
+        self.items.append(item)
+
+    def end(self):
+        """Add all items to Kodi and close the folder"""
+
+        xbmcplugin.addDirectoryItems(addon_handle, [item.directory_item() for item in self.items], len(self.items))
+        xbmcplugin.endOfDirectory(addon_handle)
+
+
 def top_level_page():
     """The main menu"""
 
@@ -368,6 +777,10 @@ def top_level_page():
             dialog.ok(S.THEO_WARN, S.DISCLAIMER)
         addon.setSetting(SettingID.STARTUP_MSG, 'false')
 
+    # Until the translations are ready the menus use our own strings, rather than waiting for them
+    if enable_scrapper and outdated_translations():
+        start_translations_update()
+
     # Auto set language, if it has never been set and Kodi is configured for something else then English
     isolang = xbmc.getLanguage(xbmc.ISO_639_1)
     if not addon.getSetting(SettingID.LANG_HIST) and isolang != 'en':
@@ -377,52 +790,98 @@ def top_level_page():
             # Reload for this instance
             global global_language
             global_language = addon.getSetting(SettingID.LANG) or 'E'
+            forget_translations()
         except StopIteration:
             # No suitable language was found, just write something to history, so this check won't run again
             addon.setSetting(SettingID.LANG_HIST, 'E')
 
     fanart = os.path.join(addon.getAddonInfo('path'), addon.getAddonInfo('fanart'))
 
-    MenuItem(
+    listing = Listing()
+    listing.add(MenuItem(
         url=request_to_self(M.BIBLE),
         title=T.BIBLE or S.BIBLE,
         icon=ICON_BIBLE,
         fanart=fanart
-    ).add_item_in_kodi()
-    MenuItem(
+    ))
+    listing.add(MenuItem(
         url=request_to_self(M.MAGAZINES),
         title=T.MAGAZINES or S.MAGAZINES,
         icon=ICON_WATCHTOWER,
         fanart=fanart
-    ).add_item_in_kodi()
-    MenuItem(
+    ))
+    listing.add(MenuItem(
         url=request_to_self(M.BOOKS),
         title=T.BOOKS or S.BOOKS,
         icon=ICON_BOOKS,
         fanart=fanart
-    ).add_item_in_kodi()
-    xbmcplugin.endOfDirectory(addon_handle)
+    ))
+    listing.end()
 
 
 def bible_page():
     """Bible menu"""
 
-    success = False
+    listing = Listing()
     for bible in 'bi12', 'nwt':
         try:
             request = PublicationData(pub=bible, booknum=0, lang=global_language)
             pub = get_pub_data(request)
-            PublicationItem(pub).add_item_in_kodi()
-            success = True
+            listing.add(PublicationItem(pub))
         except NotFoundError:
             pass
 
-    if not success:
+    if not listing.items:
         xbmcgui.Dialog().ok('', S.NOT_AVAIL)
         # Note: return will prevent Kodi from creating an empty folder view
         return
 
-    xbmcplugin.endOfDirectory(addon_handle)
+    listing.end()
+
+
+def magazine_years(pub):
+    # type: (str) -> list
+    """Return the years that may have recordings of a magazine"""
+
+    # 2008 was the first year of recordings in English
+    # Other languages are different, but we'll just have to try and fail
+    max_year = date.today().year + 1
+    ranges = {'w': range(2008, max_year),
+              'wp': range(2008, max_year),
+              'ws': range(2013, 2018),  # first english: 2013-08-15, last 2018-12
+              'g': range(2008, max_year)}
+    return list(ranges[pub])
+
+
+def magazine_issues(pub, year):
+    # type: (str, int) -> list
+    """Return the issue codes a magazine may have had during a year"""
+
+    # Determine release dates
+    if year == date.today().year:
+        max_month = date.today().month + 1
+        ranges = {'w': range(1, max_month),
+                  'wp': range(1, 4, max_month),
+                  'g': range(3, 4, max_month)}
+        issues = ['{}{:02}'.format(year, month) for month in ranges[pub]]
+    elif year >= 2018:
+        ranges = {'w': range(1, 13),
+                  'wp': (1, 5, 9),
+                  'g': (3, 7, 11)}
+        issues = ['{}{:02}'.format(year, month) for month in ranges[pub]]
+    elif year >= 2016:
+        ranges = {'w': range(1, 13),
+                  'ws': range(1, 13),
+                  'wp': range(1, 13, 2),  # odd months
+                  'g': range(2, 13, 2)}  # even months
+        issues = ['{}{:02}'.format(year, month) for month in ranges[pub]]
+    else:
+        days = {'wp': '01',
+                'w': '15',
+                'ws': '15',
+                'g': ''}
+        issues = ['{}{:02}{}'.format(year, month, days[pub]) for month in range(1, 13)]
+    return issues
 
 
 def magazine_page(pub=None, year=None):
@@ -434,111 +893,95 @@ def magazine_page(pub=None, year=None):
     :param pub: Display a list of years for this magazine.
     :param year: Display a list of issues from this year.
     """
+    listing = Listing()
+
     # Magazine list
     if not pub:
-        MenuItem(
+        listing.add(MenuItem(
             url=request_to_self(M.MAGAZINES, pub='g'),
             title=T.AWAKE or S.AWAKE,
             icon=ICON_AWAKE
-        ).add_item_in_kodi()
+        ))
 
-        MenuItem(
+        listing.add(MenuItem(
             url=request_to_self(M.MAGAZINES, pub='wp'),
             title=T.WT or S.WT,
             icon=ICON_WATCHTOWER
-        ).add_item_in_kodi()
+        ))
 
-        MenuItem(
+        listing.add(MenuItem(
             url=request_to_self(M.MAGAZINES, pub='w'),
             title=T.WT_STUDY or S.WT_STUDY,
             icon=ICON_WATCHTOWER
-        ).add_item_in_kodi()
+        ))
 
         # Simplified only existed in a few languages
         if global_language in ('E', 'F', 'I', 'T', 'S'):
-            MenuItem(
+            listing.add(MenuItem(
                 url=request_to_self(M.MAGAZINES, pub='ws'),
                 title=T.WT_SIMPLE or S.WT_SIMPLE,
                 icon=ICON_WATCHTOWER
-            ).add_item_in_kodi()
+            ))
 
     # Year list
     elif not year:
-        # 2008 was the first year of recordings in English
-        # Other languages are different, but we'll just have to try and fail
-        max_year = date.today().year + 1
-        ranges = {'w': range(2008, max_year),
-                  'wp': range(2008, max_year),
-                  'ws': range(2013, 2018),  # first english: 2013-08-15, last 2018-12
-                  'g': range(2008, max_year)}
-
-        for year in sorted(ranges[pub], reverse=True):
-            MenuItem(
-                url=request_to_self(M.MAGAZINES, pub=pub, year=year),
+        index = get_issue_index(pub)
+        this_year = date.today().year
+        template = request_template(M.MAGAZINES, pub=pub, year='{year}')
+        for year in sorted(magazine_years(pub), reverse=True):
+            # Hide past years where no issues are available
+            if year < this_year and all(is_known_missing(index.get(issue)) for issue in magazine_issues(pub, year)):
+                continue
+            listing.add(MenuItem(
+                url=template.format(year=year),
                 title=str(year)
-            ).add_item_in_kodi()
+            ))
 
     # Issue list
     else:
-        # Determine release dates
-        if year == date.today().year:
-            max_month = date.today().month + 1
-            ranges = {'w': range(1, max_month),
-                      'wp': range(1, 4, max_month),
-                      'g': range(3, 4, max_month)}
-            issues = ['{}{:02}'.format(year, month) for month in ranges[pub]]
-        elif year >= 2018:
-            ranges = {'w': range(1, 13),
-                      'wp': (1, 5, 9),
-                      'g': (3, 7, 11)}
-            issues = ['{}{:02}'.format(year, month) for month in ranges[pub]]
-        elif year >= 2016:
-            ranges = {'w': range(1, 13),
-                      'ws': range(1, 13),
-                      'wp': range(1, 13, 2),  # odd months
-                      'g': range(2, 13, 2)}  # even months
-            issues = ['{}{:02}'.format(year, month) for month in ranges[pub]]
-        else:
-            days = {'wp': '01',
-                    'w': '15',
-                    'ws': '15',
-                    'g': ''}
-            issues = ['{}{:02}{}'.format(year, month, days[pub]) for month in range(1, 13)]
-
-        success = False
-        for issue in issues:
-            try:
-                request = PublicationData(pub, issue=issue, lang=global_language)
-                get_pub_data(request)
-                PublicationItem(next(cache.publ.select(request))).add_item_in_kodi(total=len(issues))
-                success = True
-            except NotFoundError:
-                pass
-
-        if not success:
+        index = get_issue_index(pub)
+        # Skip issues that are known to be missing, and add any known issues that don't follow the pattern
+        issues = [issue for issue in magazine_issues(pub, year) if not is_known_missing(index.get(issue))]
+        issues += [row.issue for row in index.values() if row.available and row.year == year]
+        issues = sorted(set(issues))
+        requests = [PublicationData(pub, issue=issue, lang=global_language) for issue in issues]
+        # There are at most 12 issues per year, so probe them all at once
+        with cache.batch():
+            results = dict(get_pub_data_many(requests, max_workers=12))
+        # Results arrive in random order, list them in issue order
+        found = [results[i] for i in range(len(requests)) if results[i]]
+        template = request_template(M.OPEN, pubdata=PublicationData(pub=pub, issue='{issue}'))
+        download_template = request_template(M.DOWNLOAD, pubdata=PublicationData(pub=pub, issue='{issue}'))
+        for result in found:
+            listing.add(PublicationItem(result, url=template.format(issue=result.issue),
+                                        download_url=download_template.format(issue=result.issue)))
+
+        if not found:
             xbmcgui.Dialog().ok('', S.NOT_AVAIL)
             # Note: return will prevent Kodi from creating an empty folder view
             return
 
-    xbmcplugin.endOfDirectory(addon_handle)
+    listing.end()
 
 
 def pub_content_page(pubdata):
     # type: (PublicationData) -> None
     """Browse any publication"""
 
+    listing = Listing()
+
     if pubdata.booknum == 0:
-        # Always get a refreshed bible index page
-        pub, content = download_pub_data(pubdata)
-        items = map(PublicationItem, content)
+        template = request_template(M.OPEN, pubdata=PublicationData(pub=pubdata.pub, booknum='{booknum}'))
+        download_template = request_template(M.DOWNLOAD, pubdata=PublicationData(pub=pubdata.pub, booknum='{booknum}'))
+        for book in get_bible_index(pubdata):
+            listing.add(PublicationItem(book, url=template.format(booknum=book.booknum),
+                                        download_url=download_template.format(booknum=book.booknum)))
     else:
         xbmcplugin.setContent(addon_handle, 'songs')
-        pub, media_list = download_pub_data(pubdata)
-        items = [MediaItem(m) for m in sorted(media_list, key=lambda x: x.track)]
+        for item in media_items(pubdata, get_media_list(pubdata)):
+            listing.add(item)
 
-    for item in items:
-        item.add_item_in_kodi()
-    xbmcplugin.endOfDirectory(addon_handle)
+    listing.end()
 
 
 def books_page():
@@ -549,15 +992,16 @@ def books_page():
              if result.pub not in ('g', 'w', 'wp', 'ws', 'nwt', 'bi12')
              if result.failed is None]
 
+    listing = Listing()
     for b in sorted(items, key=lambda x: x.title):
-        b.add_item_in_kodi()
+        listing.add(b)
 
-    MenuItem(
+    listing.add(MenuItem(
         url=request_to_self(M.ADD_BOOKS),
         title=S.ADD_MORE
-    ).add_item_in_kodi()
+    ))
 
-    xbmcplugin.endOfDirectory(addon_handle)
+    listing.end()
 
 
 def add_books_dialog(auto=False):
@@ -567,22 +1011,44 @@ def add_books_dialog(auto=False):
             'yb12 yb13 yb14 yb15 yb16 yb17 yc ypq'.split()
 
     if auto or xbmcgui.Dialog().yesno(S.AUTO_SCAN, S.SCAN_QUESTION):
+        requests = [PublicationData(pub=book, lang=global_language) for book in books]
+        found = {}  # index, publication (or None)
         progressbar = xbmcgui.DialogProgress()
         progressbar.create(S.AUTO_SCAN)
+        progressbar.update(0, S.SCANNING)
         try:
-            for i in range(len(books)):
-                if progressbar.iscanceled():
-                    break
-                progressbar.update(i * 100 // len(books), S.SCANNING + ' ' + books[i])
+            # Save everything with a single commit
+            with cache.batch():
+                results = get_pub_data_many(requests, max_workers=scan_threads)
                 try:
-                    get_pub_data(PublicationData(pub=books[i], lang=global_language))
-                except NotFoundError:
-                    pass
-            else:
-                xbmcgui.Dialog().ok(S.AUTO_SCAN, S.SCAN_DONE)
+                    for i, pub in results:
+                        found[i] = pub
+                        progressbar.update(len(found) * 100 // len(books), S.SCANNING + ' ' + books[i])
+                        if progressbar.iscanceled():
+                            break
+                finally:
+                    # Don't start any more downloads
+                    results.close()
         finally:
             progressbar.close()
 
+        report = []
+        for i, book in enumerate(books):
+            if i not in found:
+                status = S.NOT_SCANNED
+            elif found[i] is None:
+                status = S.NOT_AVAIL
+            else:
+                status = found[i].title
+            report.append('[B]{}[/B]  {}'.format(book, status))
+
+        heading = S.SCAN_DONE if len(found) == len(books) else S.AUTO_SCAN
+        dialog = xbmcgui.Dialog()
+        try:
+            dialog.textviewer(heading, '\n'.join(report))  # Kodi v16
+        except AttributeError:
+            dialog.ok(heading, S.SCAN_DONE)
+
     else:
         code = xbmcgui.Dialog().input(S.ENTER_PUB)
         if code:
@@ -593,6 +1059,44 @@ def add_books_dialog(auto=False):
                 xbmcgui.Dialog().ok('', S.WRONG_CODE)
 
 
+def get_languages():
+    # type: () -> list
+    """Get all languages from cache (download the list if needed), sorted by name"""
+
+    languages = list(cache.lang.select())
+    # The list hardly ever changes
+    if not languages or datetime.now() > languages[0].refreshed + timedelta(days=30):
+        progressbar = xbmcgui.DialogProgress()
+        progressbar.create('', S.LOADING_LANG)
+        progressbar.update(1)
+        try:
+            # Without network, keep using the old list if there is one
+            data = get_json(LANGUAGE_API, exit_on_error=not languages)
+        except ConnectionFailedError:
+            log('using outdated language list')
+            data = None
+        finally:
+            progressbar.close()
+
+        if data:
+            now = datetime.now()
+            # Note: data['languages'] is a list
+            languages = [LanguageData(langcode=l['langcode'],
+                                      symbol=l.get('symbol'),
+                                      name=l['name'],
+                                      display=l['name'] + ' / ' + l['vernacularName'],
+                                      refreshed=now)
+                         for l in data['languages']]
+            with cache.batch():
+                # Remove all
+                cache.lang.delete(LanguageData())
+                cache.lang.upsert_many(languages)
+
+    # Note: the list from jw.org is already sorted by name, but the database isn't
+    languages.sort(key=lambda l: l.name)
+    return languages
+
+
 def language_dialog(pubdata=None, track=None, preselect=None):
     # type: (PublicationData, int, str) -> None
     """Show a dialog window with languages
@@ -601,57 +1105,53 @@ def language_dialog(pubdata=None, track=None, preselect=None):
     :param track: Dialog will play this track instead of setting language (needs pubdata)
     :param preselect: ISO language code to search for and set as global language
     """
-    progressbar = xbmcgui.DialogProgress()
-    progressbar.create('', S.LOADING_LANG)
-    progressbar.update(1)
+    # Get language data in the form of (lang, name)
+    if pubdata:
+        progressbar = xbmcgui.DialogProgress()
+        progressbar.create('', S.LOADING_LANG)
+        progressbar.update(1)
+        try:
+            # This is a big one, keep it for a while, since the user may want to play more tracks
+            info = {}
+            data = getpubmedialinks_json(pubdata, alllangs=True, max_age=timedelta(hours=1), info=info)
+            # The track lists of all languages are in there, so playback won't need another request.
+            # A saved response has been saved before, and saving it again would make old track lists look new.
+            if info['cache'] != 'hit':
+                save_all_languages(pubdata, data)
+        finally:
+            progressbar.close()
+        # Note: data['languages'] is a dict
+        languages = [(code, data['languages'][code]['name']) for code in data['languages']]
+        # Sort by name (list is provided sorted by code)
+        languages.sort(key=lambda x: x[1])
+    else:
+        all_languages = get_languages()
+        if preselect:
+            # Look it up in the index
+            l = next(cache.lang.select(LanguageData(symbol=preselect)))
+            log('autoselecting language: {}'.format(l.langcode))
+            set_language_action(l.langcode, l.display)
+            return
+        languages = [(l.langcode, l.display) for l in all_languages]
 
-    try:
-        # Get language data in the form of (lang, name)
-        if pubdata:
-            data = getpubmedialinks_json(pubdata, alllangs=True)
-            # Note: data['languages'] is a dict
-            languages = [(code, data['languages'][code]['name']) for code in data['languages']]
-            # Sort by name (list is provided sorted by code)
-            languages.sort(key=lambda x: x[1])
-        else:
-            # Note: the list from jw.org is already sorted by ['name']
-            data = get_json(LANGUAGE_API)
-            if preselect:
-                for l in data['languages']:
-                    if l.get('symbol') == preselect:
-                        log('autoselecting language: {}'.format(l['langcode']))
-                        set_language_action(l['langcode'], l['name'] + ' / ' + l['vernacularName'])
-                        return
-                else:
-                    raise StopIteration
-            else:
-                # Note: data['languages'] is a list
-                languages = [(l['langcode'], l['name'] + ' / ' + l['vernacularName'])
-                             for l in data['languages']]
-
-        # Get the languages matching the ones from history and put them first
-        history = addon.getSetting(SettingID.LANG_HIST).split()
-        languages = [l for l in languages if l[0] in history] + languages
-
-        dialog_strings = []
-        dialog_actions = []
-        for code, name in languages:
-            dialog_strings.append(name)
-            if pubdata:
-                request = request_to_self(M.PLAY, pubdata=pubdata, lang=code, track=track)
-                # Opens normally, like from a folder view
-                dialog_actions.append('PlayMedia(' + request + ')')
-            else:
-                request = request_to_self(M.SET_LANG, lang=code, langname=name)
-                # RunPlugin opens in the background
-                dialog_actions.append('RunPlugin(' + request + ')')
+    # Get the languages matching the ones from history and put them first
+    history = addon.getSetting(SettingID.LANG_HIST).split()
+    languages = [l for l in languages if l[0] in history] + languages
 
-    finally:
-        progressbar.close()
+    selection = xbmcgui.Dialog().select('', [name for code, name in languages])
+    if selection < 0:
+        return
 
-    selection = xbmcgui.Dialog().select('', dialog_strings)
-    if selection >= 0:
-        xbmc.executebuiltin(dialog_actions[selection])
+    # Only create the action for the selected language
+    code, name = languages[selection]
+    if pubdata:
+        request = request_to_self(M.PLAY, pubdata=pubdata, lang=code, track=track)
+        # Opens normally, like from a folder view
+        xbmc.executebuiltin('PlayMedia(' + request + ')')
+    else:
+        request = request_to_self(M.SET_LANG, lang=code, langname=name)
+        # RunPlugin opens in the background
+        xbmc.executebuiltin('RunPlugin(' + request + ')')
 
 
 def set_language_action(lang, printable_name=None):
@@ -661,8 +1161,8 @@ def set_language_action(lang, printable_name=None):
     addon.setSetting(SettingID.LANG_NAME, printable_name or lang)
     save_language_history(lang)
 
-    if lang != 'E' and enable_scrapper:
-        update_translations(lang)
+    if lang != 'E':
+        start_translations_update()
 
 
 def save_language_history(lang):
@@ -679,36 +1179,292 @@ def play_track(pubdata, track, resolve=False):
     """Start playback of a track in a publication"""
 
     try:
-        pub, media_list = download_pub_data(pubdata)
-        item = next(MediaItem(m) for m in media_list if m.track == track)
+        item = next(MediaItem(m) for m in get_media_list(pubdata) if m.track == track)
+        use_downloads([item])
         if resolve:
             xbmcplugin.setResolvedUrl(addon_handle, True, item.listitem_with_resolved_url())
         else:
-            pl = xbmc.PlayList(xbmc.PLAYLIST_MUSIC)
-            pl.clear()
-            pl.add(item.resolved_url, item.listitem())
-            xbmc.Player().play(pl)
+            play_items([item])
     except (NotFoundError, StopIteration):
         xbmcgui.Dialog().ok('', S.NOT_AVAIL)
 
 
+def play_all_action(pubdata, track):
+    # type: (PublicationData, int) -> None
+    """Play all tracks in a publication, starting with track
+
+    The playlist gets the URLs of the audio files, so Kodi won't have to run the add-on again for every track.
+    """
+    try:
+        items = [item for item in media_items(pubdata, get_media_list(pubdata)) if item.track >= track]
+    except NotFoundError:
+        items = []
+    if not items:
+        xbmcgui.Dialog().ok('', S.NOT_AVAIL)
+        return
+    use_downloads(items)
+    play_items(items)
+
+
+def play_items(items):
+    # type: (list) -> None
+    """Replace the music playlist with MediaItems and start playing"""
+
+    pl = xbmc.PlayList(xbmc.PLAYLIST_MUSIC)
+    pl.clear()
+    for item in items:
+        pl.add(item.resolved_url, item.listitem())
+    xbmc.Player().play(pl)
+
+
+def use_downloads(items):
+    # type: (list) -> None
+    """Play MediaItems from downloaded files, where there are any"""
+
+    if not os.path.isdir(downloads_dir):
+        return
+    from resources.lib import downloads
+
+    for item in items:
+        path = downloads.local_path(downloads_dir, item.resolved_url)
+        if os.path.exists(path):
+            item.resolved_url = path
+            downloads.touch(path)
+
+
+def download_action(pubdata, track=None):
+    # type: (PublicationData, int) -> None
+    """Download the audio files of a publication (or one track of it) in the background
+
+    Files that are already downloaded are skipped, and unfinished ones are resumed.
+    """
+    from resources.lib import downloads
+    from resources.lib.workers import imap_unordered
+
+    try:
+        media_list = [m for m in get_media_list(pubdata) if track is None or m.track == track]
+    except NotFoundError:
+        media_list = []
+    if not media_list:
+        xbmcgui.Dialog().ok('', S.NOT_AVAIL)
+        return
+
+    missing = [m for m in media_list if not os.path.exists(downloads.local_path(downloads_dir, m.url))]
+    if not missing:
+        notification(S.DOWNLOAD_DONE, icon=xbmcgui.NOTIFICATION_INFO)
+        return
+
+    try:
+        os.makedirs(downloads_dir)
+    except OSError:
+        pass
+    # Unknown sizes don't count, the quota is a rough limit anyway
+    needed = sum(m.filesize or 0 for m in missing)
+    keep = [downloads.local_path(downloads_dir, m.url) for m in media_list]
+    if not downloads.make_room(downloads_dir, needed, download_quota, keep=keep):
+        notification(S.NO_ROOM)
+        return
+
+    monitor = xbmc.Monitor()
+
+    def fetch(m):
+        try:
+            downloads.download(http_client, m.url, downloads.local_path(downloads_dir, m.url),
+                               filesize=m.filesize, checksum=m.checksum, is_canceled=monitor.abortRequested)
+            return True
+        except IOError:
+            log('failed to download: ' + m.url, xbmc.LOGERROR)
+            log_exception()
+            return False
+
+    log('downloading {} files'.format(len(missing)))
+    progressbar = xbmcgui.DialogProgressBG()
+    progressbar.create(S.DOWNLOADING)
+    failed = 0
+    try:
+        for done, (i, ok) in enumerate(imap_unordered(fetch, missing, download_threads), 1):
+            if not ok:
+                failed += 1
+            progressbar.update(done * 100 // len(missing), message='{}/{}'.format(done, len(missing)))
+    finally:
+        progressbar.close()
+
+    if failed:
+        notification(S.DOWNLOAD_FAILED)
+    else:
+        notification(S.DOWNLOAD_DONE, icon=xbmcgui.NOTIFICATION_INFO)
+
+
+def delete_downloads_action():
+    """Remove all downloaded files"""
+
+    if xbmcgui.Dialog().yesno(S.DELETE_DOWNLOADS, S.DELETE_QUESTION):
+        import shutil
+        shutil.rmtree(downloads_dir, ignore_errors=True)
+
+
+def prefetch_action():
+    """Refresh the cache of the current language, run in the background by the service
+
+    Requests are made one at a time, with a pause in between, and not at all while something is playing.
+    """
+    global background
+    background = True
+
+    monitor = xbmc.Monitor()
+    player = xbmc.Player()
+
+    if enable_scrapper:
+        update_translations()
+
+    cached = {(row.pub, row.issue, row.booknum): row
+              for row in cache.publ.select(PublicationData(lang=global_language))}
+
+    requests = [PublicationData(pub=bible, booknum=0, lang=global_language) for bible in ('bi12', 'nwt')]
+    # Recent magazine issues (new ones may have been released), except the ones known to be missing
+    for pub in 'g', 'wp', 'w':
+        index = get_issue_index(pub)
+        requests += [PublicationData(pub, issue=issue, lang=global_language)
+                     for issue in magazine_issues(pub, date.today().year)
+                     if not is_known_missing(index.get(issue))]
+    # Books that are already in the cache
+    requests += [PublicationData(pub=row.pub, issue=row.issue, booknum=row.booknum, lang=global_language)
+                 for row in cached.values()
+                 if row.pub not in ('g', 'w', 'wp', 'ws', 'nwt', 'bi12')
+                 if row.failed is None]
+
+    # Skip what has been refreshed (or has failed) within the last day
+    def is_fresh(row):
+        last = row and (row.failed or row.refreshed)
+        return last is not None and datetime.now() < last + timedelta(days=1)
+
+    requests = [request for request in requests
+                if not is_fresh(cached.get((request.pub, request.issue, request.booknum)))]
+
+    log('prefetching {} publications'.format(len(requests)))
+    for request in requests:
+        # Back off while media is playing, so that we don't steal any bandwidth
+        while player.isPlaying():
+            if monitor.waitForAbort(30):
+                return
+        try:
+            download_pub_data(request, exit_on_error=False)
+        except NotFoundError:
+            pass
+        except ConnectionFailedError:
+            # Try again next time, and leave the rest of the list to run
+            log('prefetching failed: {}'.format(request.pub), xbmc.LOGWARNING)
+        if monitor.waitForAbort(PREFETCH_DELAY):
+            return
+
+
+def open_cache():
+    """Connect to the cache database (and create it if needed)"""
+
+    from resources.lib.database import CacheDatabase
+
+    try:
+        os.makedirs(addon_dir)  # needed first run
+    except OSError:
+        pass
+    log('cache database: ' + cache_path)
+    return CacheDatabase(cache_path)
+
+
+def open_http_client():
+    """Create the HTTP client, which keeps connections open for the lifetime of this script"""
+
+    from resources.lib.httpclient import Client, DEFAULT_USER_AGENT
+
+    return Client(user_agent=addon.getSetting(SettingID.USER_AGENT) or DEFAULT_USER_AGENT)
+
+
+def open_artwork():
+    """Create the cache of icons (nothing is read from disk until it's used)"""
+
+    from resources.lib.artwork import ArtworkCache
+
+    return ArtworkCache(artwork_dir, ARTWORK_QUOTA, ARTWORK_RETRY)
+
+
+def fetch_artwork():
+    """Download the icons that were missing or new in this run, if any"""
+
+    # Only if the artwork cache has been used at all
+    if 'resources.lib.artwork' not in sys.modules or not artwork.pending:
+        return
+    with timing.Span('artwork', 'fetch', {'files': len(artwork.pending)}):
+        log('downloading {} icons'.format(len(artwork.pending)))
+        failed = artwork.fetch_pending(http_client, ARTWORK_THREADS)
+    if failed:
+        log('failed to download {} icons'.format(failed), xbmc.LOGWARNING)
+
+
+def save_timing():
+    """Write a summary of the timing to the log, and save a trace if enabled"""
+
+    log('timing: ' + timing.summary(started), xbmc.LOGINFO)
+    if addon.getSetting(SettingID.TIMING_TRACE) == 'true':
+        try:
+            os.makedirs(addon_dir)
+        except OSError:
+            pass
+        timing.save_trace(os.path.join(addon_dir, 'trace.jsonl'), started, sys.argv[1:])
+
+
+def is_db_error(e):
+    """Check if an exception comes from sqlite3, without importing it"""
+
+    sqlite3 = sys.modules.get('sqlite3')
+    return sqlite3 is not None and isinstance(e, sqlite3.Error)
+
+
 addon_handle = int(sys.argv[1])  # needed for gui
 addon = xbmcaddon.Addon()  # needed for info
 global_language = addon.getSetting(SettingID.LANG) or 'E'
 enable_scrapper = addon.getSetting(SettingID.SCRAPPER) == 'true'
+if addon.getSetting(SettingID.TIMING) == 'true':
+    timing.enable()
+try:
+    scan_threads = int(addon.getSetting(SettingID.SCAN_THREADS))
+except ValueError:
+    scan_threads = 8
+try:
+    download_threads = int(addon.getSetting(SettingID.DOWNLOAD_THREADS))
+except ValueError:
+    download_threads = 2
+try:
+    download_quota = int(addon.getSetting(SettingID.DOWNLOAD_QUOTA)) * 1024 ** 3
+except ValueError:
+    download_quota = 4 * 1024 ** 3
+
+# Translations of the current language, loaded by get_translation()
+translations = None  # type: dict
+# Set while update_translations is running
+translations_property = addon.getAddonInfo('id') + '.translations'
+
+# When running in the background (the GUI may be used for something else)
+background = False
 
 addon_dir = xbmc.translatePath(addon.getAddonInfo('profile'))
-try:
-    os.makedirs(addon_dir)  # needed first run
-except OSError:
-    pass
 cache_path = os.path.join(addon_dir, 'cache.db')
+downloads_dir = os.path.join(addon_dir, 'downloads')
+artwork_dir = os.path.join(addon_dir, 'artwork')
+
+# Not created until they are needed, since many modes only use one of them (or none)
+cache = LazyObject(open_cache)  # type: CacheDatabase
+http_client = LazyObject(open_http_client)  # type: Client
+artwork = LazyObject(open_artwork)  # type: ArtworkCache
 
 # Special class that will lookup its values in Kodi's language file
 S = LocalizedStringID(addon.getLocalizedString)
 
-# Tested in Kodi 18: disables all viewtypes except list, and there will be no icons in the list
-xbmcplugin.setContent(addon_handle, 'files')
+# Special class that will lookup its values in the database of scrapped translations
+if enable_scrapper:
+    T = ScrappedStringID(get_translation)
+else:
+    # This will return None for all lookups
+    T = ScrappedStringID(lambda x: None)
 
 # The awkward way Kodi passes arguments to the add-on...
 # argv[2] is a URL query string, probably passed by request_to_self()
@@ -722,21 +1478,20 @@ arg_mode = args.get(Q.MODE)
 # Do this before connecting to database
 if arg_mode == M.CLEAN_CACHE:
     if xbmcgui.Dialog().yesno(S.CLEAN_CACHE, S.CLEAN_QUESTION):
-        if os.path.exists(cache_path):
-            os.remove(cache_path)
+        # Write-ahead log files too
+        for path in cache_path, cache_path + '-wal', cache_path + '-shm':
+            if os.path.exists(path):
+                os.remove(path)
+        import shutil
+        shutil.rmtree(artwork_dir, ignore_errors=True)
         xbmcgui.Dialog().ok(S.CLEAN_CACHE, S.CACHE_CLEANED)
 
-try:
-    log('cache database: ' + cache_path)
-    cache = CacheDatabase(cache_path)
-
-    # Special class that will lookup its values in the database of scrapped translations
-    if enable_scrapper:
-        T = ScrappedStringID(get_translation)
-    else:
-        # This will return None for all lookups
-        T = ScrappedStringID(lambda x: None)
+# Tested in Kodi 18: disables all viewtypes except list, and there will be no icons in the list
+if arg_mode in (None, M.BIBLE, M.MAGAZINES, M.BOOKS) or arg_mode == M.OPEN and Q.TRACK not in args:
+    xbmcplugin.setContent(addon_handle, 'files')
 
+dispatch_started = time.time()
+try:
     arg_pub = PublicationData(pub=args.get(Q.PUB),
                               issue=args.get(Q.ISSUE),
                               lang=args.get(Q.LANG) or global_language,
@@ -776,17 +1531,41 @@ try:
         save_language_history(arg_pub.lang)
         play_track(arg_pub, int(args[Q.TRACK]))
 
+    elif arg_mode == M.PLAY_ALL:
+        play_all_action(arg_pub, int(args[Q.TRACK]))
+
+    elif arg_mode == M.DOWNLOAD:
+        download_action(arg_pub, args.get(Q.TRACK) and int(args[Q.TRACK]))
+
+    elif arg_mode == M.DELETE_DOWNLOADS:
+        delete_downloads_action()
+
+    elif arg_mode == M.PREFETCH:
+        prefetch_action()
+
+    elif arg_mode == M.TRANSLATIONS:
+        update_translations()
+
     elif arg_mode == M.CLEAN_CACHE:
         # Since translations was removed with the cache, update them now
-        if global_language != 'E' and enable_scrapper:
-            update_translations(global_language)
+        start_translations_update()
+
+    # Last, since the listing doesn't need to wait for this
+    fetch_artwork()
 
     # Note: no need to close database, due to how sqlite works
     # Only point in closing a connection would be to free memory
     # but this script runs and exits, so there's no point in that
 
-except DBError:
+except Exception as e:
+    if not is_db_error(e):
+        raise
     log('unknown database error', level=xbmc.LOGERROR)
-    log(traceback.format_exc(), level=xbmc.LOGERROR)
+    log_exception()
     notification(S.DB_ERROR)
     exit(1)
+
+finally:
+    if timing.enabled:
+        timing.record('dispatch', arg_mode or 'main', dispatch_started)
+        save_timing()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Compare the scrapper reading a whole finder page with the streaming parser that stops early
+
+The page is generated by fixtures.make_finder_page().
+
+Usage: python3 benchmarks/bench_scrapper.py [--repeat N] [--kbps KB_PER_SECOND]
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resources.lib.scrapper import JwOrgParser
+from fixtures import make_finder_page
+
+CHUNK_SIZE = 16384
+
+
+def chunked(text, counter, kbps=0):
+    """Yield the text in chunks like Response.iter_text(), optionally as slow as a network"""
+
+    for i in range(0, len(text), CHUNK_SIZE):
+        chunk = text[i:i + CHUNK_SIZE]
+        if kbps:
+            time.sleep(len(chunk) / 1024 / kbps)
+        counter[0] += len(chunk)
+        yield chunk
+
+
+def read_all(chunks):
+    """The old way: download everything, then parse it line by line"""
+
+    return JwOrgParser.parse(''.join(chunks))
+
+
+def read_stream(chunks):
+    return JwOrgParser.parse_stream(chunks)
+
+
+def measure(function, page, repeat, kbps):
+    best = None
+    for _ in range(repeat):
+        counter = [0]
+        start = time.perf_counter()
+        result = function(chunked(page, counter, kbps))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    counter = [0]
+    tracemalloc.start()
+    function(chunked(page, counter, kbps))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak, counter[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--kbps', type=float, default=0, help='simulated download speed (default: unlimited)')
+    args = parser.parse_args()
+
+    page = make_finder_page()
+    print('page size: {} kB'.format(len(page) // 1024))
+
+    results = []
+    for name, function in ('parse', read_all), ('parse_stream', read_stream):
+        strings, elapsed, peak, read = measure(function, page, args.repeat, args.kbps)
+        results.append(strings)
+        print('{:<14} {:8.2f} ms {:8} kB peak {:8} kB read'.format(name, elapsed * 1000, peak // 1024, read // 1024))
+
+    if results[0] != results[1]:
+        print('results differ: {} != {}'.format(*results))
+        return 1
+    print('found: ' + ', '.join(sorted(results[1])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Test data for the benchmarks, made to look like the real thing
+
+Generated rather than recorded, so that they are always the same and don't bloat the repository.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import json
+
+
+def make_finder_page(items=600):
+    """Return the HTML of a finder page, with some indentation like the real thing
+
+    A copy of https://www.jw.org/finder?docid=1011209 (the magazines page): the navigation menu and
+    the publication filter at the top, followed by a long list of magazines.
+    """
+
+    head = '''<!DOCTYPE html>
+<html lang="sv">
+  <head>
+    <meta charset="utf-8">
+    <title>Tidskrifter</title>
+  </head>
+  <body>
+    <nav>
+      <div class="BibleLandingPage" role="listitem">
+        <a href="/sv/bibeln/">Bibeln</a>
+      </div>
+      <div class="PublicationsLandingPage" role="listitem">
+        <div class="PublicationsMagazinesLandingPage" role="listitem">
+          <a href="/sv/bibliotek/tidskrifter/">Tidskrifter</a>
+        </div>
+        <div class="PublicationsDefaultLandingPage" role="listitem">
+          <a href="/sv/bibliotek/bocker/">B&ouml;cker och broschyrer</a>
+        </div>
+      </div>
+    </nav>
+    <form>
+      <select class="jsPublicationFilter">
+        <option value="">Alla</option>
+        <option value="g">Vakna!</option>
+        <option value="wp">Vakttornet</option>
+        <option value="w">Vakttornet (studieupplagan)</option>
+      </select>
+    </form>
+    <div class="publicationList">
+'''
+    item = '''      <div class="synopsis pub-{pub}">
+        <div class="syn-img"><a href="/sv/bibliotek/tidskrifter/{pub}{n}/"><img src="https://cms-imgp.jw-cdn.org/img/p/{pub}/{n}/sv/art/{pub}_sv_lsr_md.jpg" alt=""></a></div>
+        <div class="syn-body">
+          <p class="pubDesc">Nummer {n}</p>
+          <h3><a href="/sv/bibliotek/tidskrifter/{pub}{n}/">Artikel med en ganska l&aring;ng rubrik nummer {n}</a></h3>
+          <p class="desc">En kort beskrivning av vad det h&auml;r numret handlar om, s&aring; att sidan blir ungef&auml;r lika stor som den riktiga.</p>
+        </div>
+      </div>
+'''
+    tail = '''    </div>
+  </body>
+</html>
+'''
+    pubs = ('g', 'wp', 'w')
+    return head + ''.join(item.format(pub=pubs[n % 3], n=n) for n in range(items)) + tail
+
+
+def make_pubmedia_json(pub, lang='E', tracks=30, issue=None, booknum=None):
+    """Return a GETPUBMEDIALINKS response as a JSON string
+
+    :param tracks: Number of MP3 files, or Bible books if booknum is 0
+    """
+    files = []
+    for n in range(1, tracks + 1):
+        name = '{}_{}_{:02}'.format(pub, lang, n)
+        j_file = {'title': 'Chapter {} &ndash; A long title with an entity'.format(n),
+                  'file': {'url': 'https://download-a.akamaihd.net/files/media_books/0f/{}.mp3'.format(name),
+                           'stream': 'https://download-a.akamaihd.net/files/media_books/0f/{}.mp3'.format(name),
+                           'modifiedDatetime': '2019-04-30 12:11:37',
+                           'checksum': '{:032x}'.format(n * 7919)},
+                  'filesize': 5000000 + n,
+                  'trackImage': {'url': 'https://assetsnffrgf-a.akamaihd.net/assets/a/{}/{}_sqr_sm.jpg'.format(pub, pub),
+                                 'modifiedDatetime': '', 'checksum': None},
+                  'markers': None,
+                  'label': '0p',
+                  'track': n,
+                  'hasTrack': True,
+                  'pub': pub,
+                  'docid': 0,
+                  'booknum': booknum or 0,
+                  'mimetype': 'audio/mpeg',
+                  'edition': '',
+                  'editionDescr': 'Regular',
+                  'format': '',
+                  'formatDescr': 'Regular',
+                  'specialty': '',
+                  'specialtyDescr': '',
+                  'subtitled': False,
+                  'frameWidth': 0,
+                  'frameHeight': 0,
+                  'frameRate': 0,
+                  'duration': 600.5 + n,
+                  'bitRate': 64}
+        if booknum == 0:
+            # The Bible index has a zip file for every book
+            j_file.update(mimetype='application/zip', booknum=n, track=0,
+                          title='Book number {}'.format(n))
+        files.append(j_file)
+
+    return json.dumps({'pubName': 'Publication {}'.format(pub),
+                       'parentPubName': 'Publication {}'.format(pub),
+                       'booknum': booknum,
+                       'pub': pub,
+                       'issue': issue or '',
+                       'formattedDate': issue and 'Issue {}'.format(issue) or '',
+                       'fileformat': ['MP3', 'ZIP'],
+                       'track': None,
+                       'specialty': '',
+                       'pubImage': {'url': 'https://assetsnffrgf-a.akamaihd.net/assets/a/{}/{}_lg.jpg'.format(pub, pub),
+                                    'modifiedDatetime': '', 'checksum': None},
+                       'languages': {lang: {'name': 'Language {}'.format(lang), 'direction': 'ltr', 'locale': 'xx'}},
+                       'files': {lang: {'MP3': files}}})
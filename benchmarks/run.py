@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks of the database, row and scrapper layers
+
+Runs without Kodi and without network, using the kodi_six stubs in benchmarks/stubs and the data
+from fixtures.py. Times are per call (best and median of several runs), memory is the peak traced
+by tracemalloc during one call.
+
+Usage:
+    python3 benchmarks/run.py [--filter TEXT] [--json FILE]
+    python3 benchmarks/run.py --compare OLD [NEW]
+
+With --compare, the revisions are checked out in temporary git worktrees (NEW defaults to the working
+tree) and measured with the benchmarks in this file. Exits with 1 if something got slower than --threshold.
+Benchmarks that don't work with a revision (because the code looked different back then) are skipped.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import argparse
+import json
+import os
+import platform
+import runpy
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Size of the cache database, about what you get after browsing a few languages for a while
+LANGUAGES = ('E', 'Z', 'S')
+BOOKS = 40
+MAGAZINE_ISSUES = 300
+TRACKS = 20
+
+BENCHMARKS = []  # (name, setup function)
+
+
+def benchmark(name):
+    """Decorator for a setup function, which returns the function to measure"""
+
+    def decorator(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+
+    return decorator
+
+
+class Environment(object):
+    """Things that are shared by the benchmarks, created on first use"""
+
+    def __init__(self, root, tmp):
+        self.root = root
+        self.tmp = tmp
+        self._cache = None
+        self._addon = None
+
+    @property
+    def cache(self):
+        """A database filled with rows"""
+
+        if self._cache is None:
+            from resources.lib.database import CacheDatabase
+            cache = CacheDatabase(os.path.join(self.tmp, 'bench.db'))
+            # If this fails, the benchmarks that use it are skipped, instead of measuring an empty database
+            fill_cache(cache)
+            self._cache = cache
+        return self._cache
+
+    @property
+    def addon(self):
+        """The globals of addon.py, run with a mode that doesn't do anything"""
+
+        if self._addon is None:
+            sys.argv = ['plugin://plugin.audio.jwa-unofficial/', '-1', '?mode=benchmark']
+            self._addon = runpy.run_path(os.path.join(self.root, 'addon.py'), run_name='addon')
+        return self._addon
+
+
+def sample_rows():
+    """Return lists of publication and media rows for fill_cache()"""
+
+    from resources.lib.database import PublicationData, MediaData
+
+    publications = []
+    for lang in LANGUAGES:
+        publications += [PublicationData(pub='book{}'.format(n), lang=lang, title='Book {}'.format(n))
+                         for n in range(BOOKS)]
+        publications += [PublicationData(pub='nwt', booknum=n, lang=lang, title='Bible book {}'.format(n))
+                         for n in range(1, 67)]
+        publications += [PublicationData(pub='w', issue='{}{:02}'.format(2008 + n // 12, n % 12 + 1), lang=lang,
+                                         title='Issue {}'.format(n))
+                         for n in range(MAGAZINE_ISSUES)]
+    media = []
+    for p in publications:
+        for track in range(1, TRACKS + 1):
+            m = MediaData.copy(p)
+            m.track = track
+            m.url = 'https://download-a.akamaihd.net/files/{}_{}_{}_{}.mp3'.format(p.pub, p.issue, p.lang, track)
+            m.duration = 600
+            media.append(m)
+    return publications, media
+
+
+def fill_cache(cache):
+    """Insert all rows from sample_rows() with plain SQL, so it works with any version of the tables"""
+
+    publications, media = sample_rows()
+    conn = cache._conn
+    for table, rows in (cache.publ, publications), (cache.media, media):
+        columns = [col for col in rows[0].__slots__ if not col.startswith('_')]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(table.name, ','.join(columns), ','.join('?' * len(columns)))
+        conn.executemany(sql, [[getattr(row, col) for col in columns] for row in rows])
+    conn.commit()
+
+
+@benchmark('datarow.init[1000]')
+def bench_row_init(env):
+    from resources.lib.database import MediaData
+
+    def run():
+        for i in range(1000):
+            MediaData(pub='bh', lang='E', track=i, url='https://example.com/bh.mp3', title='Chapter')
+
+    return run
+
+
+@benchmark('datarow.copy[1000]')
+def bench_row_copy(env):
+    from resources.lib.database import MediaData, PublicationData
+
+    pub = PublicationData(pub='w', issue='201905', lang='E', title='The Watchtower')
+
+    def run():
+        for _ in range(1000):
+            MediaData.copy(pub)
+
+    return run
+
+
+@benchmark('datarow.items[1000]')
+def bench_row_items(env):
+    from resources.lib.database import MediaData
+
+    row = MediaData(pub='w', issue='201905', booknum=None, lang='E', track=3)
+
+    def run():
+        for _ in range(1000):
+            # Older revisions return a generator
+            list(row.items())
+
+    return run
+
+
+@benchmark('database.where[1000]')
+def bench_where(env):
+    from resources.lib.database import MediaData, where
+
+    items = list(MediaData(pub='w', issue='201905', booknum=None, lang='E', track=3).items())
+
+    def run():
+        for _ in range(1000):
+            where(items)
+
+    return run
+
+
+@benchmark('table.select_key[100]')
+def bench_select_key(env):
+    from resources.lib.database import MediaData
+
+    cache = env.cache
+
+    def run():
+        for track in range(100):
+            list(cache.media.select(MediaData(pub='book1', issue=None, booknum=None, lang='Z', track=track)))
+
+    return run
+
+
+@benchmark('table.select_tracks')
+def bench_select_tracks(env):
+    from resources.lib.database import MediaData, PublicationData
+
+    cache = env.cache
+    pub = PublicationData(pub='w', issue='201905', booknum=None, lang='S')
+
+    def run():
+        rows = list(cache.media.select(MediaData.copy(pub)))
+        assert len(rows) == TRACKS
+
+    return run
+
+
+@benchmark('table.select_lang')
+def bench_select_lang(env):
+    from resources.lib.database import PublicationData
+
+    cache = env.cache
+
+    def run():
+        list(cache.publ.select(PublicationData(lang='Z')))
+
+    return run
+
+
+@benchmark('table.insert_delete[100]')
+def bench_insert_delete(env):
+    from resources.lib.database import MediaData
+
+    cache = env.cache
+    rows = [MediaData(pub='new', issue=None, booknum=None, lang='E', track=track, url='https://example.com/new.mp3')
+            for track in range(100)]
+
+    def run():
+        for row in rows:
+            cache.media.insert(row)
+        cache.media.delete(MediaData(pub='new', lang='E'))
+
+    return run
+
+
+@benchmark('scrapper.parse')
+def bench_parse(env):
+    from resources.lib.scrapper import JwOrgParser
+    from fixtures import make_finder_page
+
+    page = make_finder_page()
+
+    def run():
+        JwOrgParser.parse(page)
+
+    return run
+
+
+@benchmark('scrapper.parse_stream')
+def bench_parse_stream(env):
+    from resources.lib.scrapper import JwOrgParser
+    from fixtures import make_finder_page
+
+    page = make_finder_page()
+    chunks = [page[i:i + 16384] for i in range(0, len(page), 16384)]
+
+    def run():
+        JwOrgParser.parse_stream(iter(chunks))
+
+    return run
+
+
+@benchmark('addon.parse_pub_files')
+def bench_parse_pub_files(env):
+    from resources.lib.database import PublicationData
+    from fixtures import make_pubmedia_json
+
+    parse_pub_files = env.addon['parse_pub_files']
+    data = make_pubmedia_json('bh', tracks=30)
+    pub = PublicationData(pub='bh', lang='E')
+
+    def run():
+        parse_pub_files(pub, json.loads(data))
+
+    return run
+
+
+@benchmark('addon.parse_bible_index')
+def bench_parse_bible_index(env):
+    from resources.lib.database import PublicationData
+    from fixtures import make_pubmedia_json
+
+    parse_pub_files = env.addon['parse_pub_files']
+    data = make_pubmedia_json('nwt', tracks=66, booknum=0)
+    pub = PublicationData(pub='nwt', booknum=0, lang='E')
+
+    def run():
+        parse_pub_files(pub, json.loads(data))
+
+    return run
+
+
+@benchmark('addon.track_listing[100]')
+def bench_track_listing(env):
+    from resources.lib.database import MediaData, PublicationData
+
+    pub_content_page = env.addon['pub_content_page']
+    pub = PublicationData(pub='bh', lang='E')
+    media = [MediaData(pub='bh', issue=None, booknum=None, lang='E', track=track, title='Chapter {}'.format(track),
+                       url='https://example.com/bh_{}.mp3'.format(track), duration=600)
+             for track in range(1, 101)]
+    # Skip the database (older revisions download the tracks right in pub_content_page)
+    pub_content_page.__globals__['get_media_list'] = lambda pubdata, *args, **kwargs: media
+    pub_content_page.__globals__['download_pub_data'] = lambda pubdata, *args, **kwargs: (pubdata, media)
+
+    def run():
+        pub_content_page(pub)
+
+    return run
+
+
+def use_bible_index(env):
+    """Point the add-on at the benchmark database, with a fresh index row for the Bible books in it"""
+
+    from datetime import datetime
+    from resources.lib.database import PublicationData
+
+    env.cache.publ.upsert_many([PublicationData(pub='nwt', booknum=0, lang='E', title='Bible',
+                                                refreshed=datetime.now())])
+    env.addon['get_bible_index'].__globals__['cache'] = env.cache
+
+    def no_download(*args, **kwargs):
+        raise AssertionError('the Bible index should come from the database')
+
+    env.addon['get_bible_index'].__globals__['download_pub_data'] = no_download
+    return PublicationData(pub='nwt', booknum=0, lang='E')
+
+
+@benchmark('addon.bible_index')
+def bench_bible_index(env):
+    get_bible_index = env.addon['get_bible_index']
+    pub = use_bible_index(env)
+
+    def run():
+        get_bible_index(pub)
+
+    return run
+
+
+@benchmark('addon.bible_listing')
+def bench_bible_listing(env):
+    pub_content_page = env.addon['pub_content_page']
+    pub = use_bible_index(env)
+
+    def run():
+        pub_content_page(pub)
+
+    return run
+
+
+def no_network(*args, **kwargs):
+    raise IOError('no network access in benchmarks')
+
+
+def measure(function, repeat):
+    """Return a dict with the best and median time per call, and peak memory of a call"""
+
+    timer = timeit.Timer(function)
+    # Enough calls to run for at least 0.2 seconds
+    number, _ = timer.autorange()
+    times = sorted(t / number for t in timer.repeat(repeat, number))
+
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'best': times[0], 'median': times[len(times) // 2], 'peak': peak}
+
+
+def run_benchmarks(root, name_filter=None, repeat=7):
+    """Run all benchmarks on the source code in root, return a dict with the results"""
+
+    sys.path[0:0] = [root, os.path.join(BENCH_DIR, 'stubs'), BENCH_DIR]
+    tmp = tempfile.mkdtemp(prefix='jwa-bench-')
+    os.environ['JWA_BENCH_PROFILE'] = tmp
+    env = Environment(root, tmp)
+    # Code that would wait for the network (like in older revisions) fails right away instead
+    socket.getaddrinfo = socket.create_connection = socket.socket.connect = no_network
+
+    results = {}
+    try:
+        for name, setup in BENCHMARKS:
+            if name_filter and name_filter not in name:
+                continue
+            try:
+                results[name] = measure(setup(env), repeat)
+            # The add-on calls exit() on errors
+            except (Exception, SystemExit) as e:
+                print('{:<28} skipped: {!r}'.format(name, e))
+                continue
+            r = results[name]
+            print('{:<28} {:>10} {:>10} {:>9} kB'.format(name, format_time(r['best']), format_time(r['median']),
+                                                         r['peak'] // 1024))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {'revision': git('describe', '--always', '--dirty', cwd=root),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'results': results}
+
+
+def run_revision(revision, args):
+    """Measure a git revision (or the working tree if None) in another process, return the results"""
+
+    tmp = tempfile.mkdtemp(prefix='jwa-bench-')
+    out = os.path.join(tmp, 'results.json')
+    root = REPO_DIR
+    try:
+        if revision:
+            root = os.path.join(tmp, 'tree')
+            git('worktree', 'add', '--detach', root, revision, cwd=REPO_DIR)
+        print('# ' + (revision or 'working tree'))
+        command = [sys.executable, os.path.abspath(__file__), '--root', root, '--json', out,
+                   '--repeat', str(args.repeat)]
+        if args.filter:
+            command += ['--filter', args.filter]
+        subprocess.check_call(command)
+        with open(out) as f:
+            return json.load(f)
+    finally:
+        if revision:
+            git('worktree', 'remove', '--force', root, cwd=REPO_DIR)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare(old, new, threshold):
+    """Print the difference between two results, return True if something is slower than threshold"""
+
+    print('\n{:<28} {:>10} {:>10} {:>8}'.format('', old['revision'], new['revision'], 'change'))
+    regression = False
+    for name in sorted(set(old['results']) & set(new['results'])):
+        before = old['results'][name]['best']
+        after = new['results'][name]['best']
+        change = after / before - 1
+        slower = change > threshold
+        regression |= slower
+        print('{:<28} {:>10} {:>10} {:>+7.0%}{}'.format(name, format_time(before), format_time(after), change,
+                                                         '  <-- slower' if slower else ''))
+    return regression
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return '{:.1f} us'.format(seconds * 1e6)
+    return '{:.2f} ms'.format(seconds * 1e3)
+
+
+def git(*args, **kwargs):
+    return subprocess.check_output(('git',) + args, cwd=kwargs.get('cwd'), universal_newlines=True).strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--filter', help='only run benchmarks with this in the name')
+    parser.add_argument('--repeat', type=int, default=7, help='number of timing runs (default: %(default)s)')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument('--compare', nargs='+', metavar='REVISION', help='compare two git revisions')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='slowdown to report as a regression, timings vary about 10%% between runs (default: %(default)s)')
+    parser.add_argument('--root', default=REPO_DIR, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        if len(args.compare) > 2:
+            parser.error('--compare takes one or two revisions')
+        old = run_revision(args.compare[0], args)
+        new = run_revision(args.compare[1] if len(args.compare) == 2 else None, args)
+        return 1 if compare(old, new, args.threshold) else 0
+
+    print('{:<28} {:>10} {:>10} {:>12}'.format('', 'best', 'median', 'peak'))
+    results = run_benchmarks(args.root, args.filter, args.repeat)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Just enough of kodi_six to import the add-on outside of Kodi
+
+Settings are kept in SETTINGS, and the profile directory is taken from $JWA_BENCH_PROFILE.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import os
+import tempfile
+
+SETTINGS = {'language': 'E', 'langhist': 'E', 'startupmsg': 'false', 'trscrapper': 'true'}
+
+
+def py2_encode(s, encoding='utf-8'):
+    return s
+
+
+def py2_decode(s, encoding='utf-8'):
+    return s
+
+
+class xbmc(object):
+    LOGDEBUG = 0
+    LOGINFO = 1
+    LOGNOTICE = 2
+    LOGWARNING = 3
+    LOGERROR = 4
+    ISO_639_1 = 0
+    PLAYLIST_MUSIC = 0
+
+    @staticmethod
+    def log(msg, level=0):
+        pass
+
+    @staticmethod
+    def translatePath(path):
+        return path
+
+    @staticmethod
+    def getLanguage(fmt=None):
+        return 'en'
+
+    @staticmethod
+    def executebuiltin(function, wait=False):
+        pass
+
+    class Monitor(object):
+        def waitForAbort(self, timeout=0):
+            return True
+
+        def abortRequested(self):
+            return True
+
+    class Player(object):
+        def isPlaying(self):
+            return False
+
+        def play(self, item=None, listitem=None):
+            pass
+
+    class PlayList(object):
+        def __init__(self, playlist):
+            self.items = []
+
+        def clear(self):
+            self.items = []
+
+        def add(self, url, listitem=None, index=-1):
+            self.items.append(url)
+
+        def size(self):
+            return len(self.items)
+
+
+class xbmcaddon(object):
+    class Addon(object):
+        def __init__(self, addon_id=None):
+            pass
+
+        def getAddonInfo(self, key):
+            if key == 'profile':
+                return os.environ.get('JWA_BENCH_PROFILE') or os.path.join(tempfile.gettempdir(), 'jwa-bench')
+            return {'id': 'plugin.audio.jwa-unofficial',
+                    'name': 'JWA Unofficial',
+                    'path': os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
+                    'fanart': 'fanart.jpg'}.get(key, '')
+
+        def getSetting(self, key):
+            return SETTINGS.get(key, '')
+
+        def setSetting(self, key, value):
+            SETTINGS[key] = value
+
+        def getLocalizedString(self, string_id):
+            return 'string {}'.format(string_id)
+
+
+class xbmcgui(object):
+    NOTIFICATION_ERROR = 'error'
+    NOTIFICATION_INFO = 'info'
+
+    class ListItem(object):
+        def __init__(self, label='', label2='', path='', offscreen=False):
+            self.label = label
+            self.path = path
+
+        def setArt(self, art):
+            pass
+
+        def setInfo(self, kind, info):
+            pass
+
+        def setProperty(self, key, value):
+            pass
+
+        def addContextMenuItems(self, items):
+            pass
+
+        def setPath(self, path):
+            self.path = path
+
+    class Dialog(object):
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+    class DialogProgress(object):
+        def __getattr__(self, name):
+            return lambda *args, **kwargs: None
+
+        def iscanceled(self):
+            return False
+
+
+class xbmcplugin(object):
+    @staticmethod
+    def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+        return True
+
+    @staticmethod
+    def addDirectoryItems(handle, items, totalItems=0):
+        return True
+
+    @staticmethod
+    def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+        pass
+
+    @staticmethod
+    def setContent(handle, content):
+        pass
+
+    @staticmethod
+    def setResolvedUrl(handle, succeeded, listitem):
+        pass
@@ -0,0 +1,144 @@
+"""
+Local copies of icons, so Kodi doesn't have to fetch them from the web for every listing
+
+Icons are saved in one directory, with a name made from a hash of the URL. Missing icons are only
+collected while listing (see ArtworkCache.get), and downloaded all at once with fetch_pending, since
+a listing shouldn't wait for them. The modification time of a file is when it was last used, and the
+least recently used files are removed when the directory gets too big. An icon that fails to download
+leaves an empty marker file, so that it isn't tried again on every listing.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import hashlib
+import os
+import time
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+FAILED_SUFFIX = '.failed'
+
+
+def file_name(url):
+    # type: (str) -> str
+    """Return the name of the local copy of an URL"""
+
+    ext = os.path.splitext(urlsplit(url).path)[1]
+    return hashlib.md5(url.encode('utf-8')).hexdigest() + ext.lower()
+
+
+class ArtworkCache(object):
+    """A directory of downloaded icons"""
+
+    def __init__(self, directory, quota, retry=1):
+        """
+        :param quota: Maximum number of bytes used by all files in directory
+        :param retry: Days before trying an icon again, if it failed to download
+        """
+        self.directory = directory
+        self.quota = quota
+        self.retry = retry * 24 * 3600
+        self.pending = []  # URLs to download
+        self._names = None  # type: set
+
+    def _saved(self):
+        # One listdir is much faster than checking every file
+        if self._names is None:
+            try:
+                self._names = set(os.listdir(self.directory))
+            except OSError:
+                self._names = set()
+        return self._names
+
+    def get(self, url):
+        # type: (str) -> str
+        """Return the path of the local copy, or the URL if there is none yet (it will be downloaded later)"""
+
+        if not url or not url.startswith(('http://', 'https://')):
+            return url
+        name = file_name(url)
+        if name in self._saved():
+            path = os.path.join(self.directory, name)
+            # Mark as used, so that icons shown on every visit (like the main menu) are kept
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            return path
+        self.add(url)
+        return url
+
+    def _failed_recently(self, name):
+        marker = name + FAILED_SUFFIX
+        if marker not in self._saved():
+            return False
+        try:
+            return time.time() - os.path.getmtime(os.path.join(self.directory, marker)) < self.retry
+        except OSError:
+            return False
+
+    def add(self, url):
+        """Download an icon later, unless it's already saved or failed recently"""
+
+        if not url or url in self.pending:
+            return
+        name = file_name(url)
+        if name not in self._saved() and not self._failed_recently(name):
+            self.pending.append(url)
+
+    def fetch_pending(self, client, max_workers=4):
+        """Download all pending icons in parallel, and then make room within the quota
+
+        Return the number of failed downloads.
+
+        :param client: httpclient.Client
+        """
+        from resources.lib import downloads
+        from resources.lib.workers import imap_unordered
+
+        if not self.pending:
+            return 0
+        try:
+            os.makedirs(self.directory)
+        except OSError:
+            pass
+
+        def fetch(url):
+            name = file_name(url)
+            # Icons are not important enough to stop for, and invalid URLs raise ValueError
+            try:
+                downloads.download(client, url, os.path.join(self.directory, name))
+            except (IOError, ValueError):
+                return name, False
+            return name, True
+
+        failed = 0
+        for i, (name, ok) in imap_unordered(fetch, self.pending, max_workers):
+            marker = os.path.join(self.directory, name + FAILED_SUFFIX)
+            try:
+                if ok:
+                    self._saved().add(name)
+                    if name + FAILED_SUFFIX in self._saved():
+                        os.remove(marker)
+                else:
+                    failed += 1
+                    # Its modification time is when it failed
+                    open(marker, 'w').close()
+            except (IOError, OSError):
+                pass
+        self.pending = []
+
+        # Forget old failures (of icons that weren't tried again)
+        for name in self._saved():
+            if name.endswith(FAILED_SUFFIX) and not self._failed_recently(name[:-len(FAILED_SUFFIX)]):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+        # The least recently used go first
+        downloads.make_room(self.directory, 0, self.quota)
+        self._names = None
+        return failed
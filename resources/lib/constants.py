@@ -4,6 +4,8 @@ and some craziness to be able to write more beautiful code
 """
 from __future__ import absolute_import, division, unicode_literals
 
+import threading
+
 ICON_BIBLE = 'https://wol.jw.org/img/bibles@3x.png'
 ICON_BOOKS = 'https://wol.jw.org/img/books@3x.png'
 ICON_WATCHTOWER = 'https://wol.jw.org/img/watchtower@3x.png'
@@ -14,6 +16,17 @@ PUBMEDIA_API = 'https://b.jw-cdn.org/apis/pub-media/GETPUBMEDIALINKS'
 FINDER_API = 'https://www.jw.org/finder'
 DOCID_MAGAZINES = '1011209'  # corresponds to the magazines page (2020-04-18)
 
+PREFETCH_DELAY = 2  # seconds between requests when prefetching in the background
+RESPONSES_MAX_AGE = 30  # days before a saved response is thrown away
+TRANSLATIONS_MAX_AGE = 30  # days before scrapping translations again
+TRANSLATIONS_THREADS = 4  # languages scrapped at the same time
+TRANSLATIONS_RETRY = 1  # days before trying a language again, even if it failed
+TRANSLATIONS_ATTEMPT = '_attempt'  # key of the row that tells when a language was last scrapped
+TRANSLATIONS_TIMEOUT = 300  # seconds before a translations update that seems to be running is ignored
+ARTWORK_THREADS = 4  # icons downloaded at the same time
+ARTWORK_QUOTA = 50 * 1024 ** 2  # bytes of icons to keep
+ARTWORK_RETRY = 1  # days before trying an icon again, if it failed to download
+
 
 class AttributeProxy(object):
     """Run a function when getting attributes
@@ -36,6 +49,31 @@ class AttributeProxy(object):
         return custom_function(original_value)
 
 
+class LazyObject(object):
+    """Stand-in for an object that is created the first time one of its attributes is used
+
+    For example:
+        o = LazyObject(function)
+        o.x
+
+    Will call function() once (even if used from several threads), and then be the same as:
+        function().x
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._object = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Only called for attributes that the proxy doesn't have itself
+        if self._object is None:
+            with self._lock:
+                if self._object is None:
+                    self._object = self._factory()
+        return getattr(self._object, name)
+
+
 class Query(object):
     """Strings for URL queries to addon itself"""
     MODE = 'mode'
@@ -52,6 +90,9 @@ class Mode(object):
     """Modes for use with mode= query to addon itself"""
     OPEN = 'open'
     PLAY = 'play'
+    PLAY_ALL = 'playall'
+    DOWNLOAD = 'download'
+    DELETE_DOWNLOADS = 'deldownloads'
     BIBLE = 'bible'
     MAGAZINES = 'mag'
     BOOKS = 'books'
@@ -59,6 +100,8 @@ class Mode(object):
     LANGUAGES = 'langlist'
     SET_LANG = 'setlang'
     CLEAN_CACHE = 'clean'
+    PREFETCH = 'prefetch'
+    TRANSLATIONS = 'translations'
 
 
 class SettingID(object):
@@ -68,6 +111,15 @@ class SettingID(object):
     LANG_NAME = 'langname'
     STARTUP_MSG = 'startupmsg'
     SCRAPPER = 'trscrapper'
+    SCAN_THREADS = 'scanthreads'
+    USER_AGENT = 'useragent'
+    PREFETCH = 'prefetch'
+    PREFETCH_INTERVAL = 'prefetchhours'
+    PREFETCH_LAST = 'prefetchlast'
+    TIMING = 'timing'
+    TIMING_TRACE = 'timingtrace'
+    DOWNLOAD_THREADS = 'downloadthreads'
+    DOWNLOAD_QUOTA = 'downloadquota'
 
 
 class ScrappedStringID(AttributeProxy):
@@ -112,6 +164,15 @@ class LocalizedStringID(AttributeProxy):
     WT_STUDY = 30032
     WT_SIMPLE = 30033
     AWAKE = 30034
+    NOT_SCANNED = 30037
+    PLAY_FROM_HERE = 30043
+    DOWNLOAD = 30046
+    DOWNLOADING = 30047
+    DOWNLOAD_DONE = 30048
+    DOWNLOAD_FAILED = 30049
+    NO_ROOM = 30050
+    DELETE_DOWNLOADS = 30051
+    DELETE_QUESTION = 30052
 
 
 def _generate_string_ids():
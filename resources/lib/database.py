@@ -9,14 +9,36 @@ from __future__ import absolute_import, division, unicode_literals
 # and according to documentation it seems to prefer unicode input
 # but execute() cannot be passed a generator, as PyCharm claims...
 import sqlite3
-from datetime import datetime
-from kodi_six import xbmc, xbmcaddon
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from kodi_six import xbmc, xbmcaddon, py2_encode
+
+# Row classes live in their own module, so they can be used without importing sqlite3
+from resources.lib import timing
+from resources.lib.datarow import Ignore, DataRow, PublicationData, MediaData, TranslationData, ResponseData, \
+    LanguageData, IssueData
 
 # Py2: str will become "unicode" in Py2, and "str" (unicode) in Py3
 str = type('')
 
 _addon_id = xbmcaddon.Addon().getAddonInfo('id')
 
+# Special column types
+# TIMESTAMP is converted to datetime by sqlite3 (with PARSE_DECLTYPES)
+# ZBLOB is decompressed when read, but must be compressed before it's written, see compress()
+COLUMN_TYPES = {'failed': 'TIMESTAMP',
+                'refreshed': 'TIMESTAMP',
+                'checked': 'TIMESTAMP',
+                'body': 'ZBLOB'}
+
+# Py2: the name must be a byte string
+sqlite3.register_converter(py2_encode('ZBLOB'), zlib.decompress)
+
+# Increase this whenever a table layout or index changes, to make CacheDatabase update the schema
+SCHEMA_VERSION = 7
+
 
 def log(msg, level=xbmc.LOGDEBUG):
     """Write to log file"""
@@ -25,176 +47,172 @@ def log(msg, level=xbmc.LOGDEBUG):
         xbmc.log(_addon_id + ': ' + line, level)
 
 
-class Ignore(object):
-    """Like None but will be ignored under certain conditions
-
-    Used in DataRow, but it will always be substituted with None before returned
-    """
-    pass
-
-
-class DataRow(object):
-    """Represents a row of data from a table, with values stored in class attributes."""
+def compress(data):
+    # type: (bytes) -> sqlite3.Binary
+    """Compress bytes for storage in a ZBLOB column"""
 
-    def __getattribute__(self, item):
-        """Substitutes Ignore with None on class attribute lookup"""
+    return sqlite3.Binary(zlib.compress(data))
 
-        value = super(DataRow, self).__getattribute__(item)
-        if value is Ignore:
-            return None
-        return value
 
-    def columns(self):
-        """Generator with all column names (names of class attributes)"""
+class Table(object):
+    """Represents a table in the database. Has methods to make basic SQL queries"""
 
-        for key in self.__dict__:
-            # Py2: dict key names are byte string, convert them
-            yield str(key)
+    default_row = DataRow
+    name = ''
+    # Columns that identify a row (unique index)
+    key = ()
+    # Key columns that may be NULL (in SQL, NULLs are never equal, so they need special treatment in the index)
+    nullable = ()
+    # Secondary indexes, tuples of columns
+    indexes = ()
 
-    def values(self):
-        """Generator with all values (Ignore becomes None)"""
+    def __init__(self, connection):
+        self._conn = connection  # type: CustomConnection
+        self._statements = {}  # signature, SQL
 
-        for col in self.columns():
-            yield getattr(self, col)
+        assert self.name and self.key
 
-    def items(self, include_ignored=False):
-        """Return a generator with (column, value)
+    def create(self):
+        """CREATE TABLE IF NOT EXISTS table (columns), and add any missing columns and indexes
 
-        :param include_ignored: If False, leave out columns that are set to Ignore
+        Columns are taken from default_row. This is only run when the schema version changes.
         """
-        if include_ignored:
-            # Do an attribute lookup, as this will convert Ignore to None
-            for col in self.columns():
-                yield (col, getattr(self, col))
-        else:
-            for col in self.__dict__:
-                if self.__dict__[col] is not Ignore:
-                    # Py2: dict key names are byte string, convert them
-                    yield (str(col), getattr(self, col))
-
-    @classmethod
-    def copy(cls, obj):
-        """Return a new instance, with (matching) attributes copied from another object"""
-
-        new = cls()
-        for key, value in obj.items():
-            if hasattr(new, key):
-                setattr(new, key, value)
-        return new
-
-
-class PublicationData(DataRow):
-    """Layout of the publications table"""
-
-    def __init__(self, pub=Ignore, issue=Ignore, booknum=Ignore, lang=Ignore,
-                 title=Ignore, icon=Ignore, fanart=Ignore, failed=Ignore):
-        # type: (str, str, int, str, str, str, str, datetime) -> None
-        self.pub = pub
-        self.issue = issue
-        self.booknum = booknum
-        self.lang = lang
-        self.title = title
-        self.icon = icon
-        self.fanart = fanart
-        self.failed = failed
-
-
-class MediaData(DataRow):
-    """Media metadata
-
-    At the moment there is no table for this type of data. It's only used within the Python script.
-    """
+        with self._conn:
+            existing = [info[1] for info in self._conn.execute('PRAGMA table_info({})'.format(self.name))]
 
-    def __init__(self, pub=Ignore, issue=Ignore, booknum=Ignore, lang=Ignore,
-                 url=Ignore, title=Ignore, icon=Ignore, fanart=Ignore, duration=Ignore, track=Ignore):
-        # type: (str, str, int, str, str, str, str, str, int, int) -> None
-        self.pub = pub
-        self.issue = issue
-        self.booknum = booknum
-        self.lang = lang
-        self.url = url
-        self.title = title
-        self.icon = icon
-        self.fanart = fanart
-        self.duration = duration
-        self.track = track
+            # Declare special types for columns that are converted by sqlite3
+            columns = []
+            for col in self.default_row().columns():
+                if col in COLUMN_TYPES:
+                    col += ' ' + COLUMN_TYPES[col]
+                columns.append(col)
 
+            if not existing:
+                self._conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(self.name, ','.join(columns)))
+            else:
+                for col, declaration in zip(self.default_row().columns(), columns):
+                    if col not in existing:
+                        try:
+                            self._conn.execute('ALTER TABLE {} ADD COLUMN {}'.format(self.name, declaration))
+                        except sqlite3.OperationalError as e:
+                            # Another instance of the add-on got there first
+                            if 'duplicate column' not in str(e):
+                                raise
 
-class TranslationData(DataRow):
-    """Layout of the translation table"""
+        self._create_indexes()
 
-    def __init__(self, key=Ignore, lang=Ignore, string=Ignore):
-        # type: (str, str, str) -> None
-        self.key = key
-        self.lang = lang
-        self.string = string
+    def _key_expr(self):
+        """Expression for the unique index, and for the ON CONFLICT clause"""
 
+        return ','.join("ifnull({}, '')".format(col) if col in self.nullable else col for col in self.key)
 
-class Table(object):
-    """Represents a table in the database. Has methods to make basic SQL queries"""
+    def _create_indexes(self):
+        """CREATE [UNIQUE] INDEX IF NOT EXISTS
 
-    default_row = DataRow
-    name = ''
-
-    def __init__(self, connection):
-        """CREATE TABLE IF NOT EXISTS table (columns)
-
-        Columns are taken from default_row
+        Since older versions of the add-on didn't have a unique index, remove any duplicates before creating it.
         """
-        self._conn = connection  # type: CustomConnection
-
-        assert self.name
-
-        # Declare special type TIMESTAMP for that column that converts it to datetime
-        columns = []
-        for col in self.default_row().columns():
-            if col == 'failed':
-                col += ' TIMESTAMP'
-            columns.append(col)
-
-        expr = 'CREATE TABLE IF NOT EXISTS {} ({})'.format(self.name, ','.join(columns))
+        key_index = self.name + '_key'
         with self._conn:
-            self._conn.execute(expr)
+            exists = self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                                        [key_index]).fetchone()
+            if not exists:
+                self._conn.execute('DELETE FROM {0} WHERE rowid NOT IN (SELECT max(rowid) FROM {0} GROUP BY {1})'
+                                   .format(self.name, self._key_expr()))
+                self._conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})'
+                                   .format(key_index, self.name, self._key_expr()))
+            for columns in self.indexes:
+                self._conn.execute('CREATE INDEX IF NOT EXISTS {} ON {} ({})'
+                                   .format('_'.join((self.name,) + columns), self.name, ','.join(columns)))
+
+    def _statement(self, signature, build):
+        """Return a cached SQL statement, or build it with build() on first use"""
+
+        try:
+            return self._statements[signature]
+        except KeyError:
+            sql = self._statements[signature] = build()
+            return sql
+
+    def _where_statement(self, kind, items):
+        """Return SQL and values for a SELECT or DELETE with conditions
+
+        The SQL only depends on which columns are tested and which of them are NULL,
+        so it's cached on that signature.
+        """
+        signature = (kind,) + tuple((col, value is None) for col, value in items)
+        values = [value for col, value in items if value is not None]
+
+        def build():
+            expr, _ = where(items)
+            if kind == 'select':
+                sql = 'SELECT {} FROM {}'.format(','.join(self.default_row.__slots__), self.name)
+            else:
+                sql = 'DELETE FROM {}'.format(self.name)
+            if expr:
+                sql += ' WHERE ' + expr
+            return sql
+
+        return self._statement(signature, build), values
+
+    def _insert_statement(self, upsert=False):
+        columns = self.default_row.__slots__
+        question_marks = ','.join(['?'] * len(columns))
+        if not upsert:
+            return 'INSERT INTO {} ({}) VALUES ({})'.format(self.name, ','.join(columns), question_marks)
+        elif sqlite3.sqlite_version_info >= (3, 24, 0):
+            updates = ','.join('{0} = excluded.{0}'.format(col) for col in columns if col not in self.key)
+            return 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT ({}) DO UPDATE SET {}'.format(
+                self.name, ','.join(columns), question_marks, self._key_expr(), updates)
+        else:
+            # Older SQLite has no UPSERT, but REPLACE does the same thing (by deleting the old row)
+            return 'INSERT OR REPLACE INTO {} ({}) VALUES ({})'.format(self.name, ','.join(columns), question_marks)
 
     def insert(self, row):
         # type: (DataRow) -> sqlite3.Cursor
         """INSERT INTO table (columns) VALUES (values)"""
-        question_marks = ','.join(['?'] * len(list(row.columns())))
-        columns = ','.join(row.columns())
-        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(self.name, columns, question_marks)
+        sql = self._statement(('insert',), self._insert_statement)
         with self._conn:
             # Py2 note: the second argument must not be a generator
-            return self._conn.execute(sql, list(row.values()))
+            return self._conn.execute(sql, row.values())
+
+    def insert_many(self, rows):
+        # type: (list) -> sqlite3.Cursor
+        """INSERT INTO table (columns) VALUES (values) for many rows, in a single transaction"""
+        sql = self._statement(('insert',), self._insert_statement)
+        with self._conn:
+            return self._conn.executemany(sql, [row.values() for row in rows])
+
+    def upsert_many(self, rows):
+        # type: (list) -> sqlite3.Cursor
+        """Insert rows, replacing any old rows with the same key, in a single transaction"""
+        sql = self._statement(('upsert',), lambda: self._insert_statement(upsert=True))
+        with self._conn:
+            return self._conn.executemany(sql, [row.values() for row in rows])
 
     def delete(self, row):
         # type: (DataRow) -> sqlite3.Cursor
         """DELETE FROM table WHERE conditions"""
-        expr, values = where(row.items(include_ignored=False))
-        sql = 'DELETE FROM {} WHERE {}'.format(self.name, expr)
+        sql, values = self._where_statement('delete', row.items(include_ignored=False))
         with self._conn:
             return self._conn.execute(sql, values)
 
     def select(self, row=None):
         # type: (DataRow) -> ()
-        """SELECT * FROM table [WHERE conditions]
+        """SELECT columns FROM table [WHERE conditions]
 
-        Returns a dict which can be used as keyword arguments to create a DataRow
+        Returns an iterator with default_row objects
         """
+        sql, values = self._where_statement('select', row.items() if row else [])
         with self._conn:
-            if not row:
-                sql = 'SELECT * FROM {}'.format(self.name)
-                result = self._conn.execute(sql)
-            else:
-                expr, values = where(row.items())
-                sql = 'SELECT * FROM {} WHERE {}'.format(self.name, expr)
-                result = self._conn.execute(sql, values)
-
-            columns = [t[0] for t in result.description]
-            for result_row in result:
-                # Turn column names and values into a dictionary
-                keywords = {col: val for col, val in zip(columns, result_row)}
-                #
-                yield keywords
+            cursor = self._conn.execute(sql, values)
+            # Create rows directly from the tuples
+            cursor.row_factory = self.default_row.row_factory
+            # Fetch everything while holding the lock, in case another thread wants to use the connection.
+            # The statement itself is already timed by execute, so this has its own category.
+            with timing.Span('fetch', self.name) as info:
+                rows = cursor.fetchall()
+                info['rows'] = len(rows)
+            return iter(rows)
 
 
 def where(items):
@@ -221,23 +239,89 @@ def where(items):
 class PublicationsTable(Table):
     default_row = PublicationData
     name = 'publications'
+    key = ('pub', 'issue', 'booknum', 'lang')
+    nullable = ('issue', 'booknum')
+    indexes = (('lang',), ('pub', 'issue', 'booknum', 'lang'))
 
     def select(self, row=None):
         # type: (DataRow) -> ()
-        """SELECT * FROM table [WHERE conditions]"""
+        """SELECT columns FROM table [WHERE conditions]"""
 
-        return (PublicationData(**keywords) for keywords in super(PublicationsTable, self).select(row))
+        return super(PublicationsTable, self).select(row)
+
+
+class MediaTable(Table):
+    default_row = MediaData
+    name = 'media'
+    key = ('pub', 'issue', 'booknum', 'lang', 'track')
+    nullable = ('issue', 'booknum')
+    indexes = (('lang',), ('pub', 'issue', 'booknum', 'lang'))
+
+    def select(self, row=None):
+        # type: (DataRow) -> ()
+        """SELECT columns FROM table [WHERE conditions]"""
+
+        return super(MediaTable, self).select(row)
+
+
+class ResponsesTable(Table):
+    default_row = ResponseData
+    name = 'responses'
+    key = ('url',)
+    # For delete_older (refreshed comes after the body, which is slow to read past)
+    indexes = (('refreshed',),)
+
+    def select(self, row=None):
+        # type: (DataRow) -> ()
+        """SELECT columns FROM table [WHERE conditions]"""
+
+        return super(ResponsesTable, self).select(row)
+
+    def delete_older(self, refreshed):
+        # type: (datetime) -> sqlite3.Cursor
+        """DELETE FROM table WHERE refreshed < refreshed"""
+
+        with self._conn:
+            return self._conn.execute('DELETE FROM {} WHERE refreshed < ?'.format(self.name), [refreshed])
+
+
+class IssuesTable(Table):
+    default_row = IssueData
+    name = 'issues'
+    key = ('pub', 'lang', 'issue')
+    indexes = (('pub', 'lang', 'year'),)
+
+    def select(self, row=None):
+        # type: (DataRow) -> ()
+        """SELECT columns FROM table [WHERE conditions]"""
+
+        return super(IssuesTable, self).select(row)
+
+
+class LanguagesTable(Table):
+    default_row = LanguageData
+    name = 'languages'
+    key = ('langcode',)
+    indexes = (('symbol',),)
+
+    def select(self, row=None):
+        # type: (DataRow) -> ()
+        """SELECT columns FROM table [WHERE conditions]"""
+
+        return super(LanguagesTable, self).select(row)
 
 
 class TranslationsTable(Table):
     default_row = TranslationData
     name = 'translations'
+    key = ('key', 'lang')
+    indexes = (('lang',),)
 
     def select(self, row=None):
         # type: (DataRow) -> ()
-        """SELECT * FROM table [WHERE conditions]"""
+        """SELECT columns FROM table [WHERE conditions]"""
 
-        return (TranslationData(**keywords) for keywords in super(TranslationsTable, self).select(row))
+        return super(TranslationsTable, self).select(row)
 
 
 class CacheDatabase(object):
@@ -249,18 +333,113 @@ class CacheDatabase(object):
 
         self.path = path
 
-        # PARSE_COLNAMES will convert the timestamp string to a datetime
-        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, factory=CustomConnection)
+        # PARSE_DECLTYPES will convert the timestamp string to a datetime
+        # The connection is shared with worker threads (see CustomConnection)
+        conn = sqlite3.connect(self.path, detect_types=sqlite3.PARSE_DECLTYPES, factory=CustomConnection,
+                               check_same_thread=False, timeout=10)
+
+        # With write-ahead logging, other instances of the add-on can read while this one writes.
+        # It's a cache, so losing the last transaction on power loss is no big deal.
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA temp_store = MEMORY')
 
+        self._conn = conn
         self.publ = PublicationsTable(conn)
+        self.media = MediaTable(conn)
         self.trans = TranslationsTable(conn)
+        self.resp = ResponsesTable(conn)
+        self.lang = LanguagesTable(conn)
+        self.issues = IssuesTable(conn)
+
+        # Kodi starts a new instance for every request, so don't touch the schema unless needed
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._update_schema()
+
+    def _update_schema(self):
+        """Create or update all tables
+
+        The service and the plugin may both start with an old database (like right after an upgrade), so take
+        the write lock first, and check the version again when it's ours.
+        """
+        with self.batch():
+            with self._conn:
+                self._conn.execute('BEGIN IMMEDIATE')
+                version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+                if version == SCHEMA_VERSION:
+                    return
+                log('updating database schema from version {} to {}'.format(version, SCHEMA_VERSION))
+                for table in self.publ, self.media, self.trans, self.resp, self.lang, self.issues:
+                    table.create()
+                self._conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    def batch(self):
+        """Context manager that groups all queries made within it in one transaction (one commit)"""
+
+        return self._conn.batch()
 
 
 class CustomConnection(sqlite3.Connection):
-    """For debugging"""
+    """For timing, and for grouping transactions
+
+    Each "with connection:" block holds a lock, so that the connection can be shared by multiple threads.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CustomConnection, self).__init__(*args, **kwargs)
+        self._batch_level = 0
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        self._lock.acquire()
+        return super(CustomConnection, self).__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            # Inside a batch, leave the commit (or rollback) to the batch
+            if self._batch_level:
+                return False
+            return super(CustomConnection, self).__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def batch(self):
+        """Suppress the commits of all "with connection:" blocks and commit once at the end
+
+        Batches can be nested, only the outermost one will commit.
+        """
+        with self._lock:
+            self._batch_level += 1
+        try:
+            yield
+        except BaseException:
+            with self._lock:
+                self._batch_level -= 1
+                if not self._batch_level:
+                    self.rollback()
+            raise
+        with self._lock:
+            self._batch_level -= 1
+            if not self._batch_level:
+                self.commit()
 
     def execute(self, sql, parameters=None):
         # type: (str, list) -> sqlite3.Cursor
-        # log('{}, {}'.format(sql, parameters))
         # Py2 note: sql being unicode is alright
-        return super(CustomConnection, self).execute(sql, parameters or [])
+        if not timing.enabled:
+            return super(CustomConnection, self).execute(sql, parameters or [])
+        start = time.time()
+        cursor = super(CustomConnection, self).execute(sql, parameters or [])
+        timing.record('sql', sql, start)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        # type: (str, list) -> sqlite3.Cursor
+        if not timing.enabled:
+            return super(CustomConnection, self).executemany(sql, seq_of_parameters)
+        start = time.time()
+        cursor = super(CustomConnection, self).executemany(sql, seq_of_parameters)
+        timing.record('sql', sql, start, dict(rows=len(seq_of_parameters)))
+        return cursor
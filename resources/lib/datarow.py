@@ -0,0 +1,239 @@
+"""
+Classes representing rows of data in the database tables
+
+Kept separate from the database module, since these are needed by every run of the add-on, while the
+database (and sqlite3) is not.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+from datetime import datetime
+
+
+class Ignore(object):
+    """Like None but will be ignored under certain conditions
+
+    Used in DataRow, but it will always be substituted with None before returned
+    """
+    pass
+
+
+# Reads a slot without falling back on DataRow.__getattr__
+_get = object.__getattribute__
+
+
+class DataRow(object):
+    """Represents a row of data from a table, with values stored in slots
+
+    Subclasses list their columns in __slots__, in the same order as the table. A column that is set to
+    Ignore is simply not assigned, so it reads as None, and is left out of queries.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, key):
+        """Only called for empty slots, which are ignored columns"""
+
+        if key in type(self).__slots__:
+            return None
+        raise AttributeError('{} has no column {}'.format(type(self).__name__, key))
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(*item) for item in self.items()))
+
+    def columns(self):
+        """Tuple with all column names"""
+
+        return self.__slots__
+
+    def values(self):
+        """List with all values (Ignore becomes None)"""
+
+        return [getattr(self, col) for col in self.__slots__]
+
+    def items(self, include_ignored=False):
+        """Return a list with (column, value)
+
+        :param include_ignored: If False, leave out columns that are set to Ignore
+        """
+        if include_ignored:
+            return [(col, getattr(self, col)) for col in self.__slots__]
+        items = []
+        for col in self.__slots__:
+            try:
+                items.append((col, _get(self, col)))
+            except AttributeError:
+                pass
+        return items
+
+    @classmethod
+    def row_factory(cls, cursor, values):
+        """Create a new instance from a tuple with all column values, no columns ignored
+
+        Can be used as sqlite3 row_factory, if all columns are selected in the right order.
+        """
+        new = cls.__new__(cls)
+        for col, value in zip(cls.__slots__, values):
+            setattr(new, col, value)
+        return new
+
+    @classmethod
+    def copy(cls, obj):
+        """Return a new instance, with (matching) attributes copied from another object"""
+
+        new = cls.__new__(cls)
+        for key, value in obj.items():
+            if key in cls.__slots__:
+                setattr(new, key, value)
+        return new
+
+
+class PublicationData(DataRow):
+    """Layout of the publications table"""
+
+    __slots__ = ('pub', 'issue', 'booknum', 'lang', 'title', 'icon', 'fanart', 'failed', 'refreshed')
+
+    def __init__(self, pub=Ignore, issue=Ignore, booknum=Ignore, lang=Ignore,
+                 title=Ignore, icon=Ignore, fanart=Ignore, failed=Ignore, refreshed=Ignore):
+        # type: (str, str, int, str, str, str, str, datetime, datetime) -> None
+        if pub is not Ignore:
+            self.pub = pub
+        if issue is not Ignore:
+            self.issue = issue
+        if booknum is not Ignore:
+            self.booknum = booknum
+        if lang is not Ignore:
+            self.lang = lang
+        if title is not Ignore:
+            self.title = title
+        if icon is not Ignore:
+            self.icon = icon
+        if fanart is not Ignore:
+            self.fanart = fanart
+        if failed is not Ignore:
+            self.failed = failed
+        if refreshed is not Ignore:
+            self.refreshed = refreshed
+
+
+class MediaData(DataRow):
+    """Layout of the media table"""
+
+    __slots__ = ('pub', 'issue', 'booknum', 'lang', 'url', 'title', 'icon', 'fanart', 'duration', 'track',
+                 'refreshed', 'filesize', 'checksum')
+
+    def __init__(self, pub=Ignore, issue=Ignore, booknum=Ignore, lang=Ignore,
+                 url=Ignore, title=Ignore, icon=Ignore, fanart=Ignore, duration=Ignore, track=Ignore,
+                 refreshed=Ignore, filesize=Ignore, checksum=Ignore):
+        # type: (str, str, int, str, str, str, str, str, int, int, datetime, int, str) -> None
+        if pub is not Ignore:
+            self.pub = pub
+        if issue is not Ignore:
+            self.issue = issue
+        if booknum is not Ignore:
+            self.booknum = booknum
+        if lang is not Ignore:
+            self.lang = lang
+        if url is not Ignore:
+            self.url = url
+        if title is not Ignore:
+            self.title = title
+        if icon is not Ignore:
+            self.icon = icon
+        if fanart is not Ignore:
+            self.fanart = fanart
+        if duration is not Ignore:
+            self.duration = duration
+        if track is not Ignore:
+            self.track = track
+        if refreshed is not Ignore:
+            self.refreshed = refreshed
+        if filesize is not Ignore:
+            self.filesize = filesize
+        if checksum is not Ignore:
+            self.checksum = checksum
+
+
+class TranslationData(DataRow):
+    """Layout of the translation table"""
+
+    __slots__ = ('key', 'lang', 'string', 'refreshed')
+
+    def __init__(self, key=Ignore, lang=Ignore, string=Ignore, refreshed=Ignore):
+        # type: (str, str, str, datetime) -> None
+        if key is not Ignore:
+            self.key = key
+        if lang is not Ignore:
+            self.lang = lang
+        if string is not Ignore:
+            self.string = string
+        if refreshed is not Ignore:
+            self.refreshed = refreshed
+
+
+class ResponseData(DataRow):
+    """Layout of the HTTP response table"""
+
+    __slots__ = ('url', 'etag', 'modified', 'body', 'refreshed')
+
+    def __init__(self, url=Ignore, etag=Ignore, modified=Ignore, body=Ignore, refreshed=Ignore):
+        # type: (str, str, str, bytes, datetime) -> None
+        if url is not Ignore:
+            self.url = url
+        if etag is not Ignore:
+            self.etag = etag
+        if modified is not Ignore:
+            self.modified = modified
+        if body is not Ignore:
+            self.body = body
+        if refreshed is not Ignore:
+            self.refreshed = refreshed
+
+
+class LanguageData(DataRow):
+    """Layout of the languages table"""
+
+    __slots__ = ('langcode', 'symbol', 'name', 'display', 'refreshed')
+
+    def __init__(self, langcode=Ignore, symbol=Ignore, name=Ignore, display=Ignore, refreshed=Ignore):
+        # type: (str, str, str, str, datetime) -> None
+        """
+        :param langcode: JW language code
+        :param symbol: ISO language code
+        :param name: English name
+        :param display: Name as displayed in the language list
+        """
+        if langcode is not Ignore:
+            self.langcode = langcode
+        if symbol is not Ignore:
+            self.symbol = symbol
+        if name is not Ignore:
+            self.name = name
+        if display is not Ignore:
+            self.display = display
+        if refreshed is not Ignore:
+            self.refreshed = refreshed
+
+
+class IssueData(DataRow):
+    """Layout of the issues table"""
+
+    __slots__ = ('pub', 'lang', 'year', 'issue', 'available', 'checked')
+
+    def __init__(self, pub=Ignore, lang=Ignore, year=Ignore, issue=Ignore, available=Ignore, checked=Ignore):
+        # type: (str, str, int, str, bool, datetime) -> None
+        """
+        :param available: If there are recordings of this issue
+        :param checked: Last time availability was checked
+        """
+        if pub is not Ignore:
+            self.pub = pub
+        if lang is not Ignore:
+            self.lang = lang
+        if year is not Ignore:
+            self.year = year
+        if issue is not Ignore:
+            self.issue = issue
+        if available is not Ignore:
+            self.available = available
+        if checked is not Ignore:
+            self.checked = checked
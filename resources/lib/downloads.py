@@ -0,0 +1,134 @@
+"""
+Downloading of audio files, for playback without streaming
+
+Files are saved with the same name as on the server, all in one directory. Unfinished files end with
+.part, and are resumed with a Range request. The modification time of a file is when it was last used,
+and the least recently used files are removed first when there isn't room for more (see make_room).
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import hashlib
+import os
+
+from resources.lib.httpclient import HTTPError
+
+try:
+    from urllib.parse import unquote, urlsplit
+except ImportError:
+    from urllib import unquote
+    from urlparse import urlsplit
+
+PART_SUFFIX = '.part'
+
+
+class DownloadError(IOError):
+    """Raised when a download was canceled, or the file is not what it should be"""
+    pass
+
+
+def local_path(directory, url):
+    # type: (str, str) -> str
+    """Return the path where the file of an URL is saved"""
+
+    return os.path.join(directory, os.path.basename(unquote(urlsplit(url).path)))
+
+
+def touch(path):
+    """Mark a file as used, so it will be removed last"""
+
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+
+
+def make_room(directory, needed, quota, keep=()):
+    # type: (str, int, int, list) -> bool
+    """Remove the least recently used files, until there is room for needed bytes more
+
+    Return False (without removing anything) if there isn't enough room even after removing all files.
+
+    :param quota: Maximum number of bytes used by all files in directory
+    :param keep: Paths of files that must not be removed
+    """
+    files = []  # last used, size, path
+    used = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        used += stat.st_size
+        if path not in keep and path[:-len(PART_SUFFIX)] not in keep:
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    if needed > quota - used + sum(size for mtime, size, path in files):
+        return False
+
+    for mtime, size, path in sorted(files):
+        if used + needed <= quota:
+            break
+        os.remove(path)
+        used -= size
+    return True
+
+
+def download(client, url, path, filesize=None, checksum=None, is_canceled=None):
+    """Download a file, resuming an unfinished download if there is one
+
+    Raises IOError on errors. The file is only saved at path if it has the right size and checksum.
+
+    :param client: httpclient.Client
+    :param filesize: Expected size (if known)
+    :param checksum: Expected MD5 sum as hex string (if known)
+    :param is_canceled: Function that returns True if the download should stop (the unfinished file is kept)
+    """
+    part = path + PART_SUFFIX
+    md5 = hashlib.md5()
+    offset = 0
+    if os.path.exists(part):
+        offset = os.path.getsize(part)
+        if checksum:
+            with open(part, 'rb') as f:
+                for chunk in iter(lambda: f.read(65536), b''):
+                    md5.update(chunk)
+
+    # Ranges are counted in the compressed data, so don't ask for compression
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = 'bytes={}-'.format(offset)
+
+    try:
+        response = client.request(url, headers=headers, timeout=30)
+    except HTTPError as e:
+        # Range Not Satisfiable: the unfinished file is already complete (or broken, which the checks will show)
+        if e.code != 416 or not offset:
+            raise
+        response = None
+
+    if response:
+        # The server may ignore the range and send everything
+        if response.status != 206:
+            offset = 0
+            md5 = hashlib.md5()
+        with open(part, 'ab' if offset else 'wb') as f:
+            for chunk in response.iter_content(65536):
+                f.write(chunk)
+                if checksum:
+                    md5.update(chunk)
+                if is_canceled and is_canceled():
+                    response.close()
+                    raise DownloadError('download canceled: ' + url)
+
+    if filesize and os.path.getsize(part) != filesize:
+        os.remove(part)
+        raise DownloadError('wrong size of downloaded file: ' + url)
+    if checksum and md5.hexdigest() != checksum.lower():
+        os.remove(part)
+        raise DownloadError('wrong checksum of downloaded file: ' + url)
+
+    # Py2 on Windows: rename won't replace existing files
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(part, path)
@@ -0,0 +1,217 @@
+"""
+A small HTTP client with persistent connections
+
+Unlike urlopen, which opens a new connection (and does a new TLS handshake) for every request,
+this keeps the connections open for as long as the script is running, one pool per host.
+It also asks for compressed transfers, and decompresses them chunk by chunk.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import codecs
+import socket
+import threading
+import zlib
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from urlparse import urljoin, urlsplit
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (compatible; plugin.audio.jwa-unofficial)'
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+class HTTPError(IOError):
+    """Raised when the server responds with an error code"""
+
+    def __init__(self, url, code, reason=''):
+        super(HTTPError, self).__init__('HTTP Error {}: {} ({})'.format(code, reason, url))
+        self.url = url
+        self.code = code
+        self.reason = reason
+
+
+class Response(object):
+    """The response of a request, with the body not yet read
+
+    The body must be read to the end (or the response closed) before the connection can be reused.
+    """
+
+    def __init__(self, client, pool_key, connection, response, url):
+        self._client = client
+        self._pool_key = pool_key
+        self._connection = connection
+        self._response = response
+        self.url = url
+        self.status = response.status
+
+        encoding = (response.getheader('Content-Encoding') or '').lower()
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        else:
+            self._decompressor = None
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def iter_content(self, chunk_size=16384):
+        """Generator with (decompressed) chunks of the body, as bytes"""
+
+        try:
+            while True:
+                chunk = self._response.read(chunk_size)
+                if not chunk:
+                    break
+                if self._decompressor:
+                    chunk = self._decompressor.decompress(chunk)
+                if chunk:
+                    yield chunk
+            if self._decompressor:
+                chunk = self._decompressor.flush()
+                if chunk:
+                    yield chunk
+        except HTTPException as e:
+            self.close()
+            raise IOError('bad response from {}: {!r}'.format(self.url, e))
+        except BaseException:
+            self.close()
+            raise
+        self._release()
+
+    def iter_text(self, chunk_size=16384, encoding='utf-8'):
+        """Generator with chunks of the body, as unicode strings"""
+
+        decoder = codecs.getincrementaldecoder(encoding)('replace')
+        for chunk in self.iter_content(chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+
+    def read(self):
+        """Return the whole body as bytes"""
+
+        return b''.join(self.iter_content())
+
+    def close(self):
+        """Stop reading, and throw away the connection since it can't be reused"""
+
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def _release(self):
+        """Put the connection back in the pool"""
+
+        if self._connection:
+            if self._response.will_close:
+                self._connection.close()
+            else:
+                self._client._put_connection(self._pool_key, self._connection)
+            self._connection = None
+
+
+class Client(object):
+    """Makes GET requests, reusing connections. It is safe to use from multiple threads."""
+
+    def __init__(self, user_agent=DEFAULT_USER_AGENT, timeout=10, max_redirects=5):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self._pools = {}  # (scheme, host), [idle connections]
+        self._lock = threading.Lock()
+
+    def _get_connection(self, pool_key, timeout):
+        """Return a tuple (connection, reused)"""
+
+        with self._lock:
+            pool = self._pools.get(pool_key)
+            if pool:
+                connection = pool.pop()
+                connection.timeout = timeout
+                if connection.sock:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+
+        scheme, host = pool_key
+        if scheme == 'https':
+            return HTTPSConnection(host, timeout=timeout), False
+        else:
+            return HTTPConnection(host, timeout=timeout), False
+
+    def _put_connection(self, pool_key, connection):
+        with self._lock:
+            self._pools.setdefault(pool_key, []).append(connection)
+
+    def close(self):
+        """Close all idle connections"""
+
+        with self._lock:
+            for pool in self._pools.values():
+                for connection in pool:
+                    connection.close()
+            self._pools = {}
+
+    def _send(self, url, headers, timeout):
+        """Make a single request (no redirects) and return a Response"""
+
+        parts = urlsplit(url)
+        pool_key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        all_headers = {'User-Agent': self.user_agent,
+                       'Accept-Encoding': 'gzip, deflate'}
+        all_headers.update(headers or {})
+
+        while True:
+            connection, reused = self._get_connection(pool_key, timeout)
+            try:
+                connection.request('GET', path, headers=all_headers)
+                response = connection.getresponse()
+            except (HTTPException, socket.error) as e:
+                connection.close()
+                # The server may have closed an idle connection, then try again with a new one
+                if reused:
+                    continue
+                if isinstance(e, HTTPException):
+                    raise IOError('bad response from {}: {!r}'.format(url, e))
+                raise
+            return Response(self, pool_key, connection, response, url)
+
+    def request(self, url, headers=None, timeout=None):
+        # type: (str, dict, float) -> Response
+        """Make a GET request and return a Response, following redirects
+
+        Raises HTTPError for error codes (4xx and 5xx).
+
+        :param headers: Extra request headers
+        :param timeout: Override the default timeout (seconds)
+        """
+        timeout = timeout or self.timeout
+
+        for _ in range(self.max_redirects + 1):
+            response = self._send(url, headers, timeout)
+
+            if response.status in REDIRECT_CODES and response.getheader('Location'):
+                # Read the (short) body so that the connection can be reused
+                response.read()
+                url = urljoin(url, response.getheader('Location'))
+                continue
+
+            if response.status >= 400:
+                reason = response._response.reason
+                response.read()
+                raise HTTPError(url, response.status, reason)
+
+            return response
+
+        raise HTTPError(url, response.status, 'too many redirects')
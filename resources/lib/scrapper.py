@@ -19,7 +19,7 @@ class JwOrgParser(HTMLParser):
     """
     The parser is adapted to https://www.jw.org/en/library/magazines/ (or corresponding page)
 
-    Call it using the class method parse()
+    Call it using the class method parse() or parse_stream()
 
     It will grab the main menu item names from the navigation menu at the top of the page,
     and the names of the magazines from the drop down list in the "display filter".
@@ -34,6 +34,10 @@ class JwOrgParser(HTMLParser):
     </select>
     """
 
+    # Keys of the strings to look for
+    MENU_KEYS = (T.BIBLE, T.MAGAZINES, T.BOOKS)
+    PUB_KEYS = ('g', 'w', 'wp', 'ws')
+
     def __init__(self):
         # Cannot use super since Py2 HTMLParser is an old style class
         HTMLParser.__init__(self)
@@ -44,6 +48,7 @@ class JwOrgParser(HTMLParser):
         self.temp = ''  # concatenation of data
         self.data_name = None  # dict key
         self.strings = {}  # key, string
+        self.options_done = False  # has passed the end of the publication filter
 
     @classmethod
     def parse(cls, data):
@@ -58,6 +63,29 @@ class JwOrgParser(HTMLParser):
                 parser.feed(line + '\n')
         return parser.strings
 
+    @classmethod
+    def parse_stream(cls, chunks):
+        # type: (Iterable[str]) -> dict
+        """Like parse(), but takes the HTML as an iterable of chunks
+
+        Stops reading as soon as all strings have been found, so the rest of the page doesn't need to be downloaded.
+        """
+        parser = cls()
+        for chunk in chunks:
+            parser.feed(chunk)
+            if parser.is_complete():
+                break
+        parser.close()
+        return parser.strings
+
+    def is_complete(self):
+        """Check if there is nothing more to find"""
+
+        if any(key not in self.strings for key in self.MENU_KEYS):
+            return False
+        # Not all languages have all magazines, but they are all listed in the same filter
+        return self.options_done or all(key in self.strings for key in self.PUB_KEYS)
+
     def _gather_data(self, name):
         self.look_for_data = self.depth
         self.data_name = name
@@ -91,7 +119,7 @@ class JwOrgParser(HTMLParser):
         elif tag == 'option':
             if self.look_for_options:
                 pub = next((str(a[1]) for a in attrs if a[0] == 'value'), '')
-                if pub in ('g', 'w', 'wp', 'ws'):
+                if pub in self.PUB_KEYS:
                     self._gather_data(pub)
 
     def handle_data(self, data):
@@ -115,10 +143,12 @@ class JwOrgParser(HTMLParser):
         if self.depth < self.look_for_data:
             # Save stored data, the first time
             if self.look_for_data and self.data_name not in self.strings:
-                self.strings[self.data_name] = self.temp.replace('\n', '')
+                # Remove indentation (when parsing a stream it's still there)
+                self.strings[self.data_name] = ''.join(line.strip() for line in self.temp.splitlines())
             # Forget about it
             self.look_for_data = 0
             self.data_name = None
 
         if self.depth < self.look_for_options:
             self.look_for_options = 0
+            self.options_done = True
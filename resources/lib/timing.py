@@ -0,0 +1,101 @@
+"""
+Opt-in timing of what the add-on spends its time on
+
+Spans are only recorded after enable() has been called, otherwise Span does (almost) nothing.
+At the end, summary() makes a single log line out of them, and save_trace() writes them all to a file.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import time
+
+enabled = False
+spans = []  # dicts with category, name, start, ms and any extra info
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+class Span(object):
+    """Context manager that records the wall time of a block
+
+    The info dict can be filled in inside the block, and is saved with the span. For example:
+        with Span('http', url) as info:
+            info['status'] = 200
+    """
+
+    __slots__ = ('category', 'name', 'info', 'start')
+
+    def __init__(self, category, name, info=None):
+        self.category = category
+        self.name = name
+        self.info = info
+
+    def __enter__(self):
+        if self.info is None:
+            self.info = {}
+        if enabled:
+            self.start = time.time()
+        return self.info
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if enabled:
+            record(self.category, self.name, self.start, self.info)
+        return False
+
+
+def record(category, name, start, info=None):
+    """Save a span that started at start (time.time()) and ends now"""
+
+    if not enabled:
+        return
+    span = dict(info or {}, category=category, name=name, start=start, ms=(time.time() - start) * 1000)
+    # Py2 and Py3: appending is thread safe
+    spans.append(span)
+
+
+def summary(started):
+    # type: (float) -> str
+    """Return one line with the totals for each category
+
+    :param started: Time when the script started
+    """
+    parts = ['total {:.0f} ms'.format((time.time() - started) * 1000)]
+    categories = []
+    for span in spans:
+        if span['category'] not in categories:
+            categories.append(span['category'])
+
+    for category in categories:
+        selected = [span for span in spans if span['category'] == category]
+        total = sum(span['ms'] for span in selected)
+        if category == 'dispatch':
+            parts += ['{} {} {:.0f} ms'.format(category, span['name'], span['ms']) for span in selected]
+            continue
+        part = '{} {}x {:.0f} ms'.format(category, len(selected), total)
+        if category == 'http':
+            kbytes = sum(span.get('bytes', 0) for span in selected) // 1024
+            outcomes = {}
+            for span in selected:
+                outcomes[span.get('cache')] = outcomes.get(span.get('cache'), 0) + 1
+            part += ' {} kB ({})'.format(kbytes, ', '.join('{} {}'.format(n, outcome)
+                                                           for outcome, n in sorted(outcomes.items(), key=str)))
+        elif category == 'fetch':
+            part += ' {} rows'.format(sum(span.get('rows', 0) for span in selected))
+        parts.append(part)
+
+    return ' | '.join(parts)
+
+
+def save_trace(path, started, argv):
+    """Append all spans to a file, as a line of JSON (one line for every time the script runs)
+
+    :param started: Time when the script started
+    :param argv: Arguments of the script
+    """
+    import json
+
+    line = json.dumps({'started': started, 'argv': argv, 'spans': spans}, sort_keys=True)
+    with open(path, 'a') as f:
+        f.write(line + '\n')
@@ -0,0 +1,71 @@
+"""
+A minimal thread pool, since Py2 doesn't ship with concurrent.futures
+
+Only use it for blocking I/O (like network requests). The database connection can
+be used from the threads, since it's locked for every query, but the writes of the
+threads end up in any batch that the calling thread has open (see CacheDatabase.batch).
+Errors are better returned than raised from the threads, since an exception (or exit())
+ends up in the calling thread, and rolls back its batch.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import sys
+import threading
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+
+def imap_unordered(function, items, max_workers=8):
+    """Run a function on all items concurrently, and yield (index, result) as soon as they are done
+
+    Exceptions raised by the function (even SystemExit) are re-raised in the calling thread.
+    If the generator is closed before it is exhausted, no new items will be started.
+
+    :param function: Will be called with each item as argument
+    :param items: Iterable of items
+    :param max_workers: Maximum number of threads running at the same time
+    """
+    items = list(items)
+    if not items:
+        return
+
+    tasks = Queue()
+    for task in enumerate(items):
+        tasks.put(task)
+    results = Queue()
+    stop = threading.Event()
+
+    def worker():
+        while not stop.is_set():
+            try:
+                index, item = tasks.get_nowait()
+            except Empty:
+                return
+            try:
+                results.put((index, function(item), None))
+            except BaseException:
+                results.put((index, None, sys.exc_info()[1]))
+
+    threads = []
+    for _ in range(max(1, min(max_workers, len(items)))):
+        thread = threading.Thread(target=worker)
+        # Don't let a stuck request keep Kodi waiting for the script to exit
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    try:
+        for _ in range(len(items)):
+            index, result, error = results.get()
+            if error is not None:
+                raise error
+            yield index, result
+        # All work is done and the threads are about to return. Let them, or Py2 may complain
+        # when it tears down the modules under a thread that is still running at exit.
+        for thread in threads:
+            thread.join()
+    finally:
+        stop.set()
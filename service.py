@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""
+Background service that keeps the cache warm, if enabled in the settings
+
+The actual work is done by the add-on itself (mode=prefetch), this only decides when.
+"""
+from __future__ import absolute_import, division, unicode_literals
+
+import time
+from kodi_six import xbmc, xbmcaddon
+
+from resources.lib.constants import Mode, SettingID
+
+CHECK_INTERVAL = 60  # seconds
+
+
+def log(msg, level=xbmc.LOGDEBUG):
+    """Write to log file"""
+
+    for line in msg.splitlines():
+        xbmc.log(xbmcaddon.Addon().getAddonInfo('id') + ': ' + line, level)
+
+
+def prefetch_is_due(addon):
+    # type: (xbmcaddon.Addon) -> bool
+    """Check settings to see if it's time for a new refresh"""
+
+    if addon.getSetting(SettingID.PREFETCH) != 'true':
+        return False
+    try:
+        interval = int(addon.getSetting(SettingID.PREFETCH_INTERVAL)) * 3600
+    except ValueError:
+        interval = 12 * 3600
+    try:
+        last = float(addon.getSetting(SettingID.PREFETCH_LAST))
+    except ValueError:
+        last = 0
+    return time.time() > last + interval
+
+
+def run():
+    monitor = xbmc.Monitor()
+    player = xbmc.Player()
+
+    while not monitor.waitForAbort(CHECK_INTERVAL):
+        # Create a new instance every time, to get fresh settings
+        addon = xbmcaddon.Addon()
+        # Don't compete with playback for bandwidth
+        if player.isPlaying() or not prefetch_is_due(addon):
+            continue
+
+        log('starting background refresh')
+        addon.setSetting(SettingID.PREFETCH_LAST, str(time.time()))
+        # RunPlugin starts the add-on in the background
+        xbmc.executebuiltin('RunPlugin(plugin://{}/?mode={})'.format(addon.getAddonInfo('id'), Mode.PREFETCH))
+
+
+if __name__ == '__main__':
+    run()